@@ -14,10 +14,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import sys
+
 from troveclient import base
 from troveclient import common
 from troveclient import utils
 
+import mgmt_python_troveclient_cache as mgmt_cache
+import mgmt_python_troveclient_transport as mgmt_transport
+import mgmt_python_troveclient_utils as mgmt_utils
+
 
 class Account(base.Resource):
     """
@@ -27,6 +34,48 @@ class Account(base.Resource):
         return "<Account: %s>" % self.name
 
 
+class AccountIndex(object):
+    """The instances of many accounts, indexed by tenant, instance and host.
+
+    tenants maps tenant IDs to their instances, as dicts, and hosts maps
+    host names to the tenants with instances there and their instances.
+    errors maps the tenants that could not be fetched to the error.
+    """
+
+    def __init__(self):
+        self.tenants = {}
+        self.instances = {}
+        self.hosts = collections.defaultdict(
+            lambda: collections.defaultdict(list))
+        self.errors = {}
+
+    def add(self, account):
+        instances = getattr(account, 'instances', None) or []
+        self.tenants[account.id] = instances
+        for instance in instances:
+            self.instances[instance['id']] = (account.id, instance)
+            self.hosts[instance.get('host')][account.id].append(instance)
+
+    def tenants_on_host(self, host):
+        """Return the IDs of the tenants with instances on host."""
+        return sorted(self.hosts.get(host, {}))
+
+    def instances_on_host(self, host):
+        """Return (tenant ID, instance) pairs for the instances on host."""
+        return [(tenant_id, instance)
+                for tenant_id, instances in sorted(
+                    self.hosts.get(host, {}).items())
+                for instance in instances]
+
+    def hosts_of_tenant(self, tenant_id):
+        """Return the hosts that the instances of a tenant run on."""
+        return sorted(set(instance.get('host')
+                          for instance in self.tenants.get(tenant_id, [])))
+
+    def tenant_of_instance(self, instance_id):
+        return self.instances[instance_id][0]
+
+
 class Accounts(base.ManagerWithFind):
     """
     Manage :class:`Account` information.
@@ -58,7 +107,37 @@ class Accounts(base.ManagerWithFind):
         """
 
         acct_name = self._get_account_name(account)
-        return self._list("/mgmt/accounts/%s" % acct_name, 'account')
+        return self._get("/mgmt/accounts/%s" % acct_name, 'account')
+
+    def show_many(self, accounts=None, concurrency=8, timeout=None,
+                  rate=None):
+        """
+        Get the instances of many accounts in parallel, by default of
+        every account in index.
+
+        :rtype: iterator of :class:`Result`, in completion order.
+        """
+        if accounts is None:
+            accounts = self.index()
+        return mgmt_utils.run_concurrently(
+            self.show, [self._get_account_name(account)
+                        for account in accounts],
+            concurrency=concurrency, timeout=timeout, rate=rate)
+
+    def build_index(self, accounts=None, concurrency=8, timeout=None,
+                    rate=None):
+        """
+        Fetch the instances of many accounts in parallel, by default of
+        every account in index, into an :class:`AccountIndex`.
+        """
+        account_index = AccountIndex()
+        for result in self.show_many(accounts, concurrency=concurrency,
+                                     timeout=timeout, rate=rate):
+            if result.error is not None:
+                account_index.errors[result.item] = result.error
+            else:
+                account_index.add(result.result)
+        return account_index
 
     # Appease the abc gods
     def list(self):
@@ -70,19 +149,63 @@ class Accounts(base.ManagerWithFind):
             if account.name:
                 return account.name
         except AttributeError:
-            return account
+            pass
+        return base.getid(account)
 
 
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_account_list(cs, args):
     """List all accounts with non-terminated instances"""
     accounts = cs.accounts_python_troveclient_ext.index()
-    utils.print_list(accounts, ['id', 'num_instances'])
-
-
-@utils.arg('account', metavar='<account>', help='Name of the account.')
+    mgmt_utils.print_list(accounts, ['id', 'num_instances'], args.format)
+
+
+@utils.arg('account', metavar='<account>', nargs='?', default=None,
+           help='Name of the account.')
+@utils.arg('--all', action='store_true', default=False,
+           help='Optional. Show the instances of every account, fetched in '
+                'parallel.')
+@utils.arg('--host', metavar='<host>', default=None,
+           help='Optional. With --all, only show the instances on this '
+                'host, and so which tenants have instances there.')
+@mgmt_utils.concurrency_args
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_account_show(cs, args):
     """Get a list of instances associated with an account"""
-    account = cs.accounts_python_troveclient_ext.show(args.account)
-    utils.print_dict(account.to_dict())
+    ext = cs.accounts_python_troveclient_ext
+    if not args.all:
+        if not args.account:
+            raise Exception("Give an account, or --all.")
+        account = ext.show(args.account)
+        mgmt_utils.print_dict(account.to_dict(), args.format)
+        return
+
+    account_index = ext.build_index(concurrency=args.concurrency,
+                                    timeout=args.timeout, rate=args.rate)
+    for tenant_id, error in sorted(account_index.errors.items()):
+        sys.stderr.write("ERROR: %s: %s\n" % (tenant_id, error))
+    if args.host:
+        pairs = account_index.instances_on_host(args.host)
+    else:
+        pairs = [(tenant_id, instance) for tenant_id, instances
+                 in sorted(account_index.tenants.items())
+                 for instance in instances]
+    rows = [dict(instance, tenant_id=tenant_id)
+            for tenant_id, instance in pairs]
+    mgmt_utils.print_list(rows, ['tenant_id', 'id', 'name', 'host',
+                                 'status'], args.format, obj_is_dict=True)
+    if args.host:
+        mgmt_utils.print_summary(
+            "%d tenants have %d instances on %s." % (
+                len(account_index.tenants_on_host(args.host)), len(rows),
+                args.host), args.format)
+    if account_index.errors:
+        raise Exception("%d of %d accounts could not be fetched." % (
+            len(account_index.errors),
+            len(account_index.errors) + len(account_index.tenants)))
@@ -14,9 +14,27 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import array
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import time
+
 from troveclient import base
 from troveclient import utils
 
+import mgmt_python_troveclient_cache as mgmt_cache
+import mgmt_python_troveclient_transport as mgmt_transport
+import mgmt_python_troveclient_utils as mgmt_utils
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class Diagnostics(base.Resource):
     """
@@ -39,14 +57,414 @@ class DiagnosticsInterrogator(base.ManagerWithFind):
         return self._get("/mgmt/instances/%s/diagnostics" %
                          base.getid(instance), "diagnostics")
 
+    def sample(self, instances, interval=10, samples=None, duration=None,
+               capacity=360, store=None, metrics=None, concurrency=8,
+               timeout=None, rate=None, on_round=None, buffers=None):
+        """
+        Get the diagnostics of many instances in parallel every interval
+        seconds, samples times or for duration seconds, into a
+        :class:`RingBuffer` per instance keeping the last capacity
+        samples.  With store, a directory, each buffer is mapped to a
+        file there and carries on from a previous run.  Pass buffers
+        from :func:`open_buffers` to keep the samples taken so far when
+        interrupted.  on_round(round, results) is called with the
+        Results of each round.
+
+        :rtype: dict of :class:`RingBuffer` by instance ID.
+        """
+        metrics = metrics or SAMPLE_METRICS
+        instance_ids = [base.getid(instance) for instance in instances]
+        if buffers is None:
+            buffers = open_buffers(instance_ids, metrics, capacity, store)
+        end = time.time() + duration if duration else None
+        count = 0
+        while True:
+            started = time.time()
+            results = list(mgmt_utils.run_concurrently(
+                self.get, instance_ids, concurrency=concurrency,
+                timeout=timeout, rate=rate))
+            for result in results:
+                if result.error is None:
+                    buffers[result.item].append(started, [
+                        getattr(result.result, metric, None)
+                        for metric in metrics])
+            count += 1
+            if on_round:
+                on_round(count, results)
+            if samples and count >= samples:
+                break
+            wait = started + interval - time.time()
+            if end is not None and time.time() + max(wait, 0) >= end:
+                break
+            if wait > 0:
+                time.sleep(wait)
+        return buffers
+
     # Appease the abc gods
     def list(self):
         pass
 
 
+SAMPLE_METRICS = ['vmRss', 'vmHwm', 'vmSize', 'vmPeak', 'threads', 'fdSize']
+
+
+def _percentile(values, percent):
+    """Linearly interpolated percentile of sorted values, as numpy's."""
+    position = (len(values) - 1) * percent / 100.0
+    low = int(math.floor(position))
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def _slope(times, values):
+    """Least squares slope of values over times."""
+    mean_time = sum(times) / len(times)
+    mean_value = sum(values) / len(values)
+    spread = sum((t - mean_time) ** 2 for t in times)
+    if not spread:
+        return 0.0
+    return sum((t - mean_time) * (v - mean_value)
+               for t, v in zip(times, values)) / spread
+
+
+class RingBuffer(object):
+    """The last capacity samples of a few metrics, in one flat array.
+
+    Each row holds the sample time followed by one float per metric,
+    NaN when missing, and rows are overwritten round robin once the
+    buffer is full.  The array is a numpy array when numpy is installed,
+    an array.array otherwise, or, with path, a memory map of that file,
+    so that samples outlive the process.  Rows with a time of 0 are free.
+
+    A file starts with a JSON header line naming the metrics and the
+    capacity, padded to a multiple of 8 bytes, and is refused if they
+    differ from those asked for.
+    """
+
+    def __init__(self, metrics, capacity=360, path=None):
+        self.metrics = list(metrics)
+        self.capacity = capacity
+        self.width = len(self.metrics) + 1
+        self.path = path
+        size = capacity * self.width * 8
+        self._next = 0
+        if path:
+            header = self._header()
+            with open(path, 'a+b') as f:
+                if os.path.getsize(path):
+                    f.seek(0)
+                    self._check_header(f.readline())
+                else:
+                    f.write(header)
+                    f.truncate(len(header) + size)
+                    f.flush()
+                if os.path.getsize(path) != len(header) + size:
+                    raise Exception("%s is truncated." % path)
+                self._mmap = mmap.mmap(f.fileno(), len(header) + size)
+            if numpy is not None:
+                self._data = numpy.frombuffer(self._mmap, dtype='float64',
+                                              offset=len(header))
+            else:
+                self._data = memoryview(self._mmap)[len(header):].cast('d')
+            times = self._data[::self.width]
+            if max(times) > 0:
+                self._next = (list(times).index(max(times)) + 1) % capacity
+        elif numpy is not None:
+            self._data = numpy.zeros(capacity * self.width)
+        else:
+            self._data = array.array('d', bytes(size))
+
+    def _header(self):
+        line = json.dumps({'metrics': self.metrics,
+                           'capacity': self.capacity})
+        return (line + ' ' * (-(len(line) + 1) % 8) + '\n').encode('utf-8')
+
+    def _check_header(self, line):
+        try:
+            header = json.loads(line.decode('utf-8'))
+            metrics, capacity = header['metrics'], header['capacity']
+        except (ValueError, KeyError, TypeError):
+            raise Exception("%s is not a sample file." % self.path)
+        if metrics != self.metrics or capacity != self.capacity:
+            raise Exception(
+                "%s holds %d samples of %s, not %d of %s; use another "
+                "--store or the same --metric and --capacity." % (
+                    self.path, capacity, ', '.join(metrics), self.capacity,
+                    ', '.join(self.metrics)))
+
+    def append(self, when, values):
+        start = self._next * self.width
+        self._data[start] = when
+        for offset, value in enumerate(values, 1):
+            self._data[start + offset] = (float('nan') if value is None
+                                          else float(value))
+        self._next = (self._next + 1) % self.capacity
+
+    def __len__(self):
+        return sum(1 for when in self._data[::self.width] if when > 0)
+
+    def close(self):
+        if self.path:
+            self._data = None
+            self._mmap.flush()
+            self._mmap.close()
+
+    def _rows(self):
+        """Return the used rows, oldest first."""
+        rows = [self._data[row * self.width:(row + 1) * self.width].tolist()
+                for row in range(self.capacity)]
+        return sorted(row for row in rows if row[0] > 0)
+
+    def summary(self):
+        """Return a dict per metric with the count, min, max, mean, 50th
+        and 95th percentiles, last value and least squares slope per hour
+        of its samples, with numpy over every metric at once if installed.
+        """
+        if numpy is not None:
+            return self._summary_numpy()
+        rows = self._rows()
+        summaries = []
+        for column, metric in enumerate(self.metrics, 1):
+            samples = [(row[0], row[column]) for row in rows
+                       if not math.isnan(row[column])]
+            summary = {'metric': metric, 'samples': len(samples)}
+            if samples:
+                times = [when for when, value in samples]
+                values = sorted(value for when, value in samples)
+                summary.update(
+                    min=values[0], max=values[-1],
+                    mean=sum(values) / len(values),
+                    p50=_percentile(values, 50), p95=_percentile(values, 95),
+                    last=samples[-1][1],
+                    slope_per_hour=_slope(times, [value for when, value
+                                                  in samples]) * 3600)
+            summaries.append(summary)
+        return summaries
+
+    def _summary_numpy(self):
+        table = numpy.asarray(self._data).reshape(self.capacity, self.width)
+        table = table[table[:, 0] > 0]
+        table = table[numpy.argsort(table[:, 0])]
+        times, values = table[:, :1], table[:, 1:]
+        valid = ~numpy.isnan(values)
+        counts = valid.sum(axis=0)
+        summaries = []
+        if len(table):
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                mean_times = (times * valid).sum(axis=0) / counts
+                mean_values = numpy.nansum(values, axis=0) / counts
+                dt = numpy.where(valid, times - mean_times, 0)
+                dv = numpy.where(valid, values - mean_values, 0)
+                spread = (dt * dt).sum(axis=0)
+                slopes = numpy.where(spread > 0, (dt * dv).sum(axis=0) /
+                                     numpy.where(spread > 0, spread, 1), 0)
+            filled = numpy.where(valid, values, numpy.nan)
+            lasts = [values[valid[:, column], column][-1]
+                     if counts[column] else None
+                     for column in range(len(self.metrics))]
+        for column, metric in enumerate(self.metrics):
+            summary = {'metric': metric, 'samples': int(counts[column])}
+            if summary['samples']:
+                column_values = filled[:, column]
+                summary.update(
+                    min=float(numpy.nanmin(column_values)),
+                    max=float(numpy.nanmax(column_values)),
+                    mean=float(mean_values[column]),
+                    p50=float(numpy.nanpercentile(column_values, 50)),
+                    p95=float(numpy.nanpercentile(column_values, 95)),
+                    last=float(lasts[column]),
+                    slope_per_hour=float(slopes[column]) * 3600)
+            summaries.append(summary)
+        return summaries
+
+
 @utils.arg('instance', metavar='<instance>', help='ID of the instance.')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_diagnostics_show(cs, args):
     """Get the diagnostics of the guest on an instance"""
     hosts = cs.diagnostics_python_troveclient_ext.get(args.instance)
-    utils.print_dict(hosts)
+    mgmt_utils.print_dict(hosts, args.format)
+
+
+INSTANCE_FIELDS = ['id', 'name', 'tenant_id', 'host', 'status']
+DIAGNOSTICS_FIELDS = ['version', 'fdSize', 'vmSize', 'vmPeak', 'vmRss',
+                      'vmHwm', 'threads']
+HWINFO_FIELDS = ['mem_total', 'num_cpus']
+
+
+def _instance_record(instance):
+    return dict((field, getattr(instance, field, None))
+                for field in INSTANCE_FIELDS)
+
+
+def _collect(cs, instance):
+    record = _instance_record(instance)
+    diagnostics = cs.diagnostics_python_troveclient_ext.get(instance.id)
+    for field in DIAGNOSTICS_FIELDS:
+        record[field] = getattr(diagnostics, field, None)
+    # Keep the diagnostics when only the hardware information fails.
+    try:
+        hwinfo = cs.hwinfo_python_troveclient_ext.get(instance.id)._info
+    except Exception as e:
+        record['error'] = 'hwinfo: %s' % e
+    else:
+        record.update(hwinfo.get('hwinfo', hwinfo))
+    return record
+
+
+@utils.arg('--output', metavar='<file>', default=None,
+           help='Optional. File to write to, stdout by default.')
+@utils.arg('--format', metavar='<format>', default=None,
+           choices=mgmt_utils.RECORD_FORMATS,
+           help='Optional. One of csv, tsv, json, jsonl or parquet (needs '
+                'pyarrow). Guessed from the --output extension, csv by '
+                'default.')
+@utils.arg('--status', metavar='<status>', default='ACTIVE',
+           help='Optional. Only collect instances with this status, '
+                'ACTIVE by default. Use "any" for all instances.')
+@utils.arg('--page-size', metavar='<page_size>', type=int, default=None,
+           help='Optional. Number of instances to list per request.')
+@mgmt_utils.concurrency_args
+@utils.service_type('database')
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
+def do_mgmt_diagnostics_collect(cs, args):
+    """Collect the diagnostics and hardware information of all instances"""
+    start = time.time()
+    instances = cs.management_python_troveclient_ext.iter_index(
+        deleted=False, page_size=args.page_size)
+    if args.status.lower() != 'any':
+        instances = (instance for instance in instances
+                     if instance.status == args.status)
+    results = mgmt_utils.run_concurrently(
+        lambda instance: _collect(cs, instance), instances,
+        concurrency=args.concurrency, timeout=args.timeout, rate=args.rate)
+    failed = []
+
+    def records():
+        for result in results:
+            if result.error is None:
+                if result.result.get('error'):
+                    failed.append(result.result)
+                yield result.result
+                continue
+            record = _instance_record(result.item)
+            record['error'] = str(result.error)
+            failed.append(record)
+            yield record
+
+    fields = INSTANCE_FIELDS + ['error'] + DIAGNOSTICS_FIELDS + HWINFO_FIELDS
+    fmt = args.format or mgmt_utils.guess_format(args.output)
+    count = mgmt_utils.write_records(records(), fields, fmt, args.output)
+    sys.stderr.write("Collected %d instances (%d failed) in %.1f seconds.\n"
+                     % (count, len(failed), time.time() - start))
+
+
+def open_buffers(instances, metrics=None, capacity=360, store=None):
+    """Open a :class:`RingBuffer` per instance, in store when given.
+
+    If one of them cannot be opened, say a file of another run with
+    other metrics, those opened already are closed again.
+    """
+    metrics = metrics or SAMPLE_METRICS
+    if store and not os.path.isdir(store):
+        os.makedirs(store)
+    buffers = {}
+    try:
+        for instance in instances:
+            instance_id = base.getid(instance)
+            buffers[instance_id] = RingBuffer(
+                metrics, capacity, store and os.path.join(
+                    store, '%s.ring' % instance_id))
+    except Exception:
+        for ring in buffers.values():
+            ring.close()
+        raise
+    return buffers
+
+
+def _seconds(value):
+    """Parse a duration such as 10, 10s, 5m or 1h into seconds."""
+    match = re.match(r'^\s*([0-9.]+)\s*([smh]?)\s*$', value)
+    if not match:
+        raise ValueError("Not a duration: %s" % value)
+    return float(match.group(1)) * {'': 1, 's': 1, 'm': 60,
+                                    'h': 3600}[match.group(2)]
+
+
+SAMPLE_FIELDS = ['instance', 'metric', 'samples', 'min', 'max', 'mean',
+                 'p50', 'p95', 'last', 'slope_per_hour']
+
+
+@utils.arg('instance', metavar='<instance>', nargs='*',
+           help='ID of the instance.')
+@utils.arg('--from-file', metavar='<file>', default=None,
+           help='Optional. File with one instance ID per line, or - for '
+                'stdin.')
+@utils.arg('--interval', metavar='<interval>', type=_seconds, default=10,
+           help='Optional. Time between samples, e.g. 10s or 1m (default '
+                '10s).')
+@utils.arg('--samples', metavar='<samples>', type=int, default=None,
+           help='Optional. Number of samples to take. Sampling goes on '
+                'until interrupted by default.')
+@utils.arg('--duration', metavar='<duration>', type=_seconds, default=None,
+           help='Optional. How long to sample for, e.g. 30m.')
+@utils.arg('--capacity', metavar='<capacity>', type=int, default=360,
+           help='Optional. Number of samples kept per instance (default '
+                '360).')
+@utils.arg('--store', metavar='<dir>', default=None,
+           help='Optional. Directory to keep the samples in, one memory '
+                'mapped file per instance, so that later runs add to them.')
+@utils.arg('--metric', metavar='<metric>', action='append', default=None,
+           help='Optional. Diagnostics field to sample. Can be repeated. '
+                'By default %s.' % ', '.join(SAMPLE_METRICS))
+@utils.arg('--sort-by', metavar='<field>', default='slope_per_hour',
+           choices=SAMPLE_FIELDS,
+           help='Optional. Field to sort on, largest first (default '
+                'slope_per_hour, so the leakiest guests come first).')
+@mgmt_utils.concurrency_args
+@utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+def do_mgmt_diagnostics_sample(cs, args):
+    """Sample the diagnostics of instances over time and summarize them"""
+    instance_ids = mgmt_utils.read_ids(args.instance, args.from_file)
+    failed_ids = set()
+
+    def on_round(count, results):
+        failed = [result for result in results if result.error is not None]
+        for result in failed:
+            failed_ids.add(result.item)
+            sys.stderr.write("ERROR: %s: %s\n" % (result.item, result.error))
+        sys.stderr.write("[%d] Sampled %d of %d instances.\n" % (
+            count, len(results) - len(failed), len(results)))
+
+    buffers = open_buffers(instance_ids, args.metric, args.capacity,
+                           args.store)
+    try:
+        cs.diagnostics_python_troveclient_ext.sample(
+            instance_ids, interval=args.interval, samples=args.samples,
+            duration=args.duration, metrics=args.metric,
+            concurrency=args.concurrency, timeout=args.timeout,
+            rate=args.rate, on_round=on_round, buffers=buffers)
+    except KeyboardInterrupt:
+        # Summarize what was sampled until interrupted.
+        pass
+    rows = []
+    for instance_id, ring in buffers.items():
+        for summary in ring.summary():
+            summary['instance'] = instance_id
+            for field in SAMPLE_FIELDS[3:]:
+                if summary.get(field) is not None:
+                    summary[field] = round(summary[field], 2)
+            rows.append(summary)
+        ring.close()
+    rows.sort(key=lambda row: (row.get(args.sort_by) is not None,
+                               row.get(args.sort_by)), reverse=True)
+    mgmt_utils.print_list(rows, SAMPLE_FIELDS, args.format, obj_is_dict=True)
+    if failed_ids:
+        raise Exception("%d of %d instances could not be sampled every "
+                        "time." % (len(failed_ids), len(instance_ids)))
@@ -14,10 +14,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import itertools
+import sys
+import time
+
 from troveclient import base
 from troveclient import common
 from troveclient import utils
 
+import mgmt_python_troveclient_cache as mgmt_cache
+import mgmt_python_troveclient_transport as mgmt_transport
+import mgmt_python_troveclient_utils as mgmt_utils
+
 
 class Host(base.Resource):
     """
@@ -27,6 +36,113 @@ class Host(base.Resource):
         return "<Host: %s>" % self.name
 
 
+class HostMap(object):
+    """Placement of the instances on the hosts, with their load.
+
+    hosts maps host names to a record of their RAM and volume use and
+    datastore mix, instances maps host names to their instances as
+    dicts, and errors maps the hosts that could not be fetched to the
+    error.  RAM is in MB and volumes in GB.
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self.instances = {}
+        self.errors = {}
+
+    def add(self, host, instance_infos, flavor_ram):
+        instances = []
+        detail = getattr(host, 'instances', None) or []
+        for instance in detail:
+            instance = dict(instance_infos.get(instance['id'], {}),
+                            **instance)
+            instance['ram'] = flavor_ram.get(
+                (instance.get('flavor') or {}).get('id'))
+            instances.append(instance)
+        used_ram = getattr(host, 'usedRAM', None)
+        if used_ram is None:
+            used_ram = sum(instance['ram'] or 0 for instance in instances)
+        # Without the flavors, share the host's RAM out evenly.
+        for instance in instances:
+            if instance['ram'] is None:
+                instance['ram'] = used_ram // len(instances)
+        total_ram = getattr(host, 'totalRAM', None)
+        datastores = collections.Counter(
+            (instance.get('datastore') or {}).get('type') or 'unknown'
+            for instance in instances)
+        self.instances[host.name] = instances
+        self.hosts[host.name] = {
+            'name': host.name,
+            'instances': len(instances),
+            'datastores': ', '.join('%s:%d' % item for item in
+                                    sorted(datastores.items())),
+            'used_ram': used_ram,
+            'total_ram': total_ram,
+            'ram_pct': (round(100.0 * used_ram / total_ram, 1)
+                        if total_ram else None),
+            'volume_gb': sum((instance.get('volume') or {}).get('size') or 0
+                             for instance in instances),
+        }
+
+    def flag(self, threshold=90):
+        """Set the flag of every host record: OVERCOMMITTED when more RAM
+        is used than the host has, HOT when more than threshold percent.
+        """
+        for record in self.hosts.values():
+            record['flag'] = ''
+            if record['ram_pct'] is None:
+                continue
+            if record['ram_pct'] > 100:
+                record['flag'] = 'OVERCOMMITTED'
+            elif record['ram_pct'] > threshold:
+                record['flag'] = 'HOT'
+
+    def suggest_migrations(self, threshold=90):
+        """
+        Suggest moving ACTIVE instances off the hosts using more than
+        threshold percent of their RAM, largest first, each to the host
+        that stays least loaded and under threshold with it.
+
+        :rtype: list of dict, with the instance, from host, to host and
+                RAM moved.
+        """
+        loads = dict((name, record['used_ram'])
+                     for name, record in self.hosts.items())
+        totals = dict((name, record['total_ram'])
+                      for name, record in self.hosts.items()
+                      if record['total_ram'])
+
+        def pct(name, extra=0):
+            return 100.0 * (loads[name] + extra) / totals[name]
+
+        suggestions = []
+        for source in sorted(totals, key=pct, reverse=True):
+            if pct(source) <= threshold:
+                break
+            candidates = sorted(
+                (instance for instance in self.instances[source]
+                 if instance.get('status') == 'ACTIVE'),
+                key=lambda instance: instance['ram'], reverse=True)
+            for instance in candidates:
+                if pct(source) <= threshold:
+                    break
+                ram = instance['ram']
+                targets = [name for name in totals if name != source and
+                           pct(name, ram) <= threshold]
+                if not targets:
+                    continue
+                target = min(targets, key=lambda name: pct(name, ram))
+                loads[source] -= ram
+                loads[target] += ram
+                suggestions.append({'id': instance['id'],
+                                    'name': instance.get('name'),
+                                    'tenant_id': instance.get('tenant_id'),
+                                    'from_host': source,
+                                    'to_host': target,
+                                    'ram': ram})
+        return suggestions
+
+
 class Hosts(base.ManagerWithFind):
     """
     Manage :class:`Host` resources.
@@ -70,6 +186,166 @@ class Hosts(base.ManagerWithFind):
         """
         return self._get("/mgmt/hosts/%s" % self._get_host_name(host), "host")
 
+    def wait_until_healthy(self, host, statuses=('ACTIVE',), timeout=None,
+                           interval=5, initial_delay=0, before=None):
+        """
+        Poll a host until every instance on it has one of statuses, or
+        the status it had in before, a dict of status by instance ID,
+        so that an instance which was SHUTDOWN may stay so.  Polling
+        starts initial_delay seconds from now, e.g. to give an update
+        the time to move the instances out of ACTIVE.
+
+        :rtype: :class:`Host`
+        """
+        before = before or {}
+        time.sleep(initial_delay)
+
+        def healthy(instance):
+            return (instance['status'] in statuses or
+                    instance['status'] == before.get(instance['id']))
+
+        def check():
+            detail = self.get(host)
+            instances = getattr(detail, 'instances', [])
+            if all(healthy(instance) for instance in instances):
+                return detail
+        return mgmt_utils.poll(check, timeout=timeout, interval=interval,
+                               max_interval=max(interval, 60))
+
+    def rolling_update(self, hosts=None, batch_size=1, concurrency=None,
+                       failure_budget=0, timeout=None, interval=5):
+        """
+        Update all instances on hosts, batch_size hosts at a time.
+        Each batch runs on up to concurrency threads, and the next batch
+        only starts once every instance of the previous one is ACTIVE
+        again, or back in the status it had before the update.  Once
+        more than failure_budget hosts failed no further batches are
+        started and the remaining hosts are reported as skipped.  By
+        default every host is updated.
+
+        :rtype: iterator of :class:`Result`, one per host.
+        """
+        if hosts is None:
+            hosts = [host.name for host in self.index()]
+        hosts = [self._get_host_name(host) for host in hosts]
+
+        def update(host):
+            before = dict((instance['id'], instance['status']) for instance
+                          in getattr(self.get(host), 'instances', []))
+            self.update_all(host)
+            # Right after update_all the instances are still ACTIVE from
+            # before the update, so the first check waits one interval.
+            return self.wait_until_healthy(host, timeout=timeout,
+                                           interval=interval,
+                                           initial_delay=interval,
+                                           before=before)
+
+        failed = 0
+        for start in range(0, len(hosts), batch_size):
+            batch = hosts[start:start + batch_size]
+            if failed > failure_budget:
+                for host in batch:
+                    yield mgmt_utils.Result(
+                        host, None, Exception("Skipped, the failure budget "
+                                              "was exhausted."), 0)
+                continue
+            for result in mgmt_utils.run_concurrently(
+                    update, batch, concurrency=concurrency or batch_size):
+                if result.error is not None:
+                    failed += 1
+                yield result
+
+    def plan_evacuation(self, host, target_hosts=None):
+        """
+        Pick a target for every instance on host, taking target_hosts in
+        turn, or None to leave the choice to the scheduler.
+
+        :rtype: list of (instance ID, target host) pairs.
+        """
+        source = self._get_host_name(host)
+        target_hosts = [self._get_host_name(target)
+                        for target in target_hosts or []]
+        if source in target_hosts:
+            raise Exception("Cannot evacuate %s onto itself." % source)
+        instances = getattr(self.get(source), 'instances', None) or []
+        targets = itertools.cycle(target_hosts or [None])
+        return [(instance['id'], next(targets)) for instance in instances]
+
+    def evacuate(self, host, target_hosts=None, concurrency=4, timeout=1800,
+                 interval=5, plan=None):
+        """
+        Migrate every instance off host in waves of concurrency instances,
+        each wave starting once the previous one finished.  A migration
+        is done once the instance is on another host, ACTIVE or back in
+        the status it had, and failed if it goes into ERROR or takes
+        longer than timeout seconds.
+        plan is the result of plan_evacuation, made here by default.
+
+        :rtype: iterator of :class:`Result`, one per instance ID, in
+                completion order.
+        """
+        if concurrency < 1:
+            raise Exception("concurrency must be at least 1.")
+        source = self._get_host_name(host)
+        if plan is None:
+            plan = self.plan_evacuation(source, target_hosts)
+        targets = dict(plan)
+        management = self.api.management_python_troveclient_ext
+
+        def migrate(instance_id):
+            done = ('ACTIVE', management.show(instance_id).status)
+            management.migrate(instance_id, host=targets[instance_id])
+
+            def check():
+                instance = management.show(instance_id)
+                if (instance.status in done and
+                        getattr(instance, 'host', None) != source):
+                    return instance
+                if instance.status == 'ERROR':
+                    raise Exception("%s went into ERROR while migrating." %
+                                    instance_id)
+            return mgmt_utils.poll(check, timeout=timeout, interval=interval,
+                                   max_interval=max(interval, 60))
+
+        instance_ids = [instance_id for instance_id, target in plan]
+        for start in range(0, len(instance_ids), concurrency):
+            for result in mgmt_utils.run_concurrently(
+                    migrate, instance_ids[start:start + concurrency],
+                    concurrency=concurrency):
+                yield result
+
+    def placement(self, hosts=None, concurrency=8, timeout=None, rate=None,
+                  page_size=None):
+        """
+        Fetch the details of every host in parallel, by default of every
+        host in index, into a :class:`HostMap`.  The instances are listed
+        once to add their datastore, flavor and volume, and the RAM of
+        each flavor is looked up when the flavors can be listed.
+        """
+        if hosts is None:
+            hosts = self.index()
+        hosts = [self._get_host_name(host) for host in hosts]
+        instance_infos = dict(
+            (info['id'], info)
+            for info in self.api.management_python_troveclient_ext
+            .iter_index(page_size=page_size, raw=True,
+                        fields=['id', 'datastore', 'flavor', 'volume']))
+        try:
+            flavor_ram = dict((str(flavor.id), flavor.ram)
+                              for flavor in self.api.flavors.list())
+        except Exception:
+            flavor_ram = {}
+
+        host_map = HostMap()
+        for result in mgmt_utils.run_concurrently(
+                self.get, hosts, concurrency=concurrency, timeout=timeout,
+                rate=rate):
+            if result.error is not None:
+                host_map.errors[result.item] = result.error
+            else:
+                host_map.add(result.result, instance_infos, flavor_ram)
+        return host_map
+
     @staticmethod
     def _get_host_name(host):
         try:
@@ -84,22 +360,178 @@ class Hosts(base.ManagerWithFind):
 
 
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_host_list(cs, args):
     """List all hosts"""
     hosts = cs.hosts_python_troveclient_ext.index()
-    utils.print_list(hosts)
+    mgmt_utils.print_list(hosts, ['name', 'instanceCount'], args.format)
 
 
 @utils.arg('host', metavar='<host>', help='Name of the host.')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_host_show(cs, args):
     """Show details of a host"""
     host = cs.hosts_python_troveclient_ext.get(args.host)
-    utils.print_dict(host)
+    mgmt_utils.print_dict(host, args.format)
+
+
+@utils.arg('--threshold', metavar='<percent>', type=float, default=90,
+           help='Optional. Percentage of RAM used above which a host is '
+                'flagged HOT and instances are moved off it (default 90).')
+@utils.arg('--suggest', action='store_true', default=False,
+           help='Optional. Print the suggested migrations instead of the '
+                'hosts.')
+@utils.arg('--page-size', metavar='<page_size>', type=int, default=None,
+           help='Optional. Number of instances to fetch per request.')
+@mgmt_utils.concurrency_args
+@utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
+def do_mgmt_host_map(cs, args):
+    """Show the load and datastore mix of every host, flag the hot ones and
+    suggest migrations off them"""
+    host_map = cs.hosts_python_troveclient_ext.placement(
+        concurrency=args.concurrency, timeout=args.timeout, rate=args.rate,
+        page_size=args.page_size)
+    for host, error in sorted(host_map.errors.items()):
+        sys.stderr.write("ERROR: %s: %s\n" % (host, error))
+    if args.suggest:
+        suggestions = host_map.suggest_migrations(args.threshold)
+        mgmt_utils.print_list(suggestions, ['id', 'name', 'tenant_id',
+                                            'from_host', 'to_host', 'ram'],
+                              args.format, obj_is_dict=True)
+        mgmt_utils.print_summary(
+            "Apply with: trove mgmt-migrate <id> --host <to_host>",
+            args.format)
+    else:
+        host_map.flag(args.threshold)
+        records = sorted(host_map.hosts.values(),
+                         key=lambda record: -(record['ram_pct'] or 0))
+        mgmt_utils.print_list(records, ['name', 'instances', 'datastores',
+                                        'used_ram', 'total_ram', 'ram_pct',
+                                        'volume_gb', 'flag'],
+                              args.format, obj_is_dict=True)
+    if host_map.errors:
+        raise Exception("%d of %d hosts could not be fetched." % (
+            len(host_map.errors),
+            len(host_map.errors) + len(host_map.hosts)))
 
 
 @utils.arg('host', metavar='<host>', help='ID of the host.')
 @utils.service_type('database')
+@mgmt_transport.transport_args
 def do_mgmt_host_update_all(cs, args):
     """Update all instances on a host"""
     result = cs.hosts_python_troveclient_ext.update_all(args.host)
+
+
+@utils.arg('host', metavar='<host>', nargs='*',
+           help='Name of a host. All hosts by default.')
+@utils.arg('--batch-size', metavar='<batch_size>', type=int, default=1,
+           help='Optional. Number of hosts to update at a time (default 1).')
+@utils.arg('--concurrency', metavar='<concurrency>', type=int, default=None,
+           help='Optional. Number of hosts of a batch to update in '
+                'parallel, the whole batch by default.')
+@utils.arg('--failure-budget', metavar='<failures>', type=int, default=0,
+           help='Optional. Number of failed hosts tolerated before no more '
+                'batches are started (default 0).')
+@utils.arg('--timeout', metavar='<timeout>', type=float, default=900,
+           help='Optional. Seconds to wait for a host to become healthy '
+                '(default 900).')
+@utils.arg('--interval', metavar='<interval>', type=float, default=5,
+           help='Optional. Initial seconds between health checks '
+                '(default 5).')
+@utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+def do_mgmt_host_rolling_update(cs, args):
+    """Update all instances of many hosts, a batch of hosts at a time"""
+    ext = cs.hosts_python_troveclient_ext
+    hosts = args.host or [host.name for host in ext.index()]
+    start = time.time()
+
+    def progress(results):
+        for done, result in enumerate(results, 1):
+            sys.stderr.write("[%d/%d] %s %s in %.1f seconds\n" % (
+                done, len(hosts), result.item,
+                'FAILED' if result.error else 'OK', result.elapsed))
+            yield result
+
+    failed = mgmt_utils.print_results(progress(ext.rolling_update(
+        hosts, batch_size=args.batch_size, concurrency=args.concurrency,
+        failure_budget=args.failure_budget, timeout=args.timeout,
+        interval=args.interval)), args.format)
+    elapsed = time.time() - start
+    mgmt_utils.print_summary(
+        "Processed %d hosts in %.1f minutes (%.2f hosts/minute)." % (
+            len(hosts), elapsed / 60, len(hosts) * 60 / max(elapsed, 1)),
+        args.format)
+    if failed:
+        raise Exception("%d of %d hosts failed." % (failed, len(hosts)))
+
+
+@utils.arg('host', metavar='<host>', help='Name of the host to drain.')
+@utils.arg('--target-hosts', metavar='<hosts>', default=None,
+           help='Optional. Comma separated hosts to move the instances to, '
+                'in turn. Left to the scheduler by default.')
+@utils.arg('--concurrency', metavar='<concurrency>',
+           type=mgmt_utils.positive_int, default=4,
+           help='Optional. Number of instances migrated per wave '
+                '(default 4).')
+@utils.arg('--timeout', metavar='<timeout>', type=float, default=1800,
+           help='Optional. Seconds to wait for one migration (default '
+                '1800).')
+@utils.arg('--interval', metavar='<interval>', type=float, default=5,
+           help='Optional. Initial seconds between status checks '
+                '(default 5).')
+@utils.arg('--dry-run', action='store_true', default=False,
+           help='Optional. Only print which instance would go where.')
+@utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+def do_mgmt_host_evacuate(cs, args):
+    """Migrate every instance off a host, in waves of parallel migrations"""
+    ext = cs.hosts_python_troveclient_ext
+    target_hosts = args.target_hosts.split(',') if args.target_hosts else None
+    plan = ext.plan_evacuation(args.host, target_hosts)
+    if args.dry_run:
+        mgmt_utils.print_list([{'id': instance_id, 'to_host': target or ''}
+                               for instance_id, target in plan],
+                              ['id', 'to_host'], args.format,
+                              obj_is_dict=True)
+        return
+    total = len(plan)
+    sys.stderr.write("Evacuating %d instances from %s in waves of %d.\n" %
+                     (total, args.host, args.concurrency))
+    start = time.time()
+
+    def progress(results):
+        for done, result in enumerate(results, 1):
+            elapsed = time.time() - start
+            rate = done / elapsed if elapsed else 0
+            eta = (total - done) / rate if rate else 0
+            sys.stderr.write(
+                "[%d/%d] %s %s in %.1f seconds, %.2f instances/minute, "
+                "ETA %.1f minutes\n" % (
+                    done, total, result.item,
+                    'FAILED' if result.error else 'OK', result.elapsed,
+                    rate * 60, eta / 60))
+            yield result
+
+    failed = mgmt_utils.print_results(progress(ext.evacuate(
+        args.host, concurrency=args.concurrency, timeout=args.timeout,
+        interval=args.interval, plan=plan)), args.format)
+    elapsed = time.time() - start
+    mgmt_utils.print_summary(
+        "Migrated %d instances in %.1f minutes (%.2f instances/minute)." % (
+            total - failed, elapsed / 60, total * 60 / max(elapsed, 1)),
+        args.format)
+    if failed:
+        raise Exception("%d of %d instances failed to migrate." %
+                        (failed, total))
@@ -17,6 +17,10 @@
 from troveclient import base
 from troveclient import utils
 
+import mgmt_python_troveclient_cache as mgmt_cache
+import mgmt_python_troveclient_transport as mgmt_transport
+import mgmt_python_troveclient_utils as mgmt_utils
+
 
 class HwInfo(base.Resource):
 
@@ -43,7 +47,10 @@ class HwInfoInterrogator(base.ManagerWithFind):
 
 @utils.arg('instance', metavar='<instance>', help='ID of the instance.')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_hwinfo_show(cs, args):
     """Get the hardware information of an instance"""
     hosts = cs.hwinfo_python_troveclient_ext.get(args.instance)
-    utils.print_dict(hosts)
+    mgmt_utils.print_dict(hosts, args.format)
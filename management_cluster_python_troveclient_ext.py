@@ -14,11 +14,21 @@
 #    under the License.
 
 
+import calendar
+import collections
+import sys
+import time
+
 from troveclient import base
 from troveclient import common
+from troveclient import exceptions
 from troveclient import utils
 from troveclient.v1 import clusters
 
+import mgmt_python_troveclient_cache as mgmt_cache
+import mgmt_python_troveclient_transport as mgmt_transport
+import mgmt_python_troveclient_utils as mgmt_utils
+
 
 class MgmtClusters(base.ManagerWithFind):
     """Manage :class:`Cluster` resources."""
@@ -32,22 +42,84 @@ class MgmtClusters(base.ManagerWithFind):
         """Get details of one cluster."""
         return self._get("/mgmt/clusters/%s" % base.getid(cluster), 'cluster')
 
-    def index(self, deleted=None, limit=None, marker=None):
+    def index(self, deleted=None, limit=None, marker=None,
+              changes_since=None, raw=False):
         """Show an overview of all local clusters.
 
-        Optionally, filter by deleted status.
+        Optionally, filter by deleted status, or ask for only the clusters
+        updated since the changes_since timestamp.  With raw, the clusters
+        are returned as the parsed dicts.
 
         :rtype: list of :class:`Cluster`.
         """
-        form = ''
         if deleted is not None:
-            if deleted:
-                form = "?deleted=true"
+            if deleted in (True, 'true', 'True', '1'):
+                deleted = 'true'
             else:
-                form = "?deleted=false"
+                deleted = 'false'
+
+        url = mgmt_utils.build_url("/mgmt/clusters", deleted=deleted,
+                                   limit=limit, marker=marker,
+                                   **{'changes-since': changes_since})
+        if raw:
+            return mgmt_utils.paginated_raw(self.api.client, url, "clusters")
+        return self._paginated(url, "clusters")
+
+    def iter_index(self, deleted=None, page_size=None, marker=None,
+                   changes_since=None, raw=False):
+        """Iterate over all local clusters, following the pagination links.
+
+        Pages of page_size clusters are only fetched as they are consumed.
+        With raw, the clusters are yielded as the parsed dicts.
+
+        :rtype: iterator of :class:`Cluster`.
+        """
+        return mgmt_utils.paginate(
+            lambda marker: self.index(deleted=deleted, limit=page_size,
+                                      marker=marker,
+                                      changes_since=changes_since, raw=raw),
+            marker=marker)
+
+    def instance_details(self, cluster, concurrency=8, timeout=None,
+                         rate=None):
+        """Get the details, diagnostics and hardware information of every
+        instance of a cluster, all fetched in parallel, merged into one
+        dict per instance.  What could not be fetched is in its error key.
+
+        :rtype: list of dict, in the order of the cluster instances.
+        """
+        api = self.api
+
+        def show(instance_id):
+            return api.management_python_troveclient_ext.show(
+                instance_id)._info
 
-        url = "/mgmt/clusters%s" % form
-        return self._paginated(url, "clusters", limit, marker)
+        def diagnostics(instance_id):
+            return api.diagnostics_python_troveclient_ext.get(
+                instance_id)._info
+
+        def hwinfo(instance_id):
+            info = api.hwinfo_python_troveclient_ext.get(instance_id)._info
+            return info.get('hwinfo', info)
+
+        fetchers = {'show': show, 'diagnostics': diagnostics,
+                    'hwinfo': hwinfo}
+        members = self.show(cluster).instances
+        calls = [(member['id'], kind) for member in members
+                 for kind in ('show', 'diagnostics', 'hwinfo')]
+        fetched = collections.defaultdict(dict)
+        errors = collections.defaultdict(list)
+        for result in mgmt_utils.run_concurrently(
+                lambda call: fetchers[call[1]](call[0]), calls,
+                concurrency=concurrency, timeout=timeout, rate=rate):
+            instance_id, kind = result.item
+            if result.error is not None:
+                errors[instance_id].append('%s: %s' % (kind, result.error))
+            else:
+                fetched[instance_id][kind] = result.result
+        return [_instance_detail(member, fetched[member['id']],
+                                 errors[member['id']])
+                for member in members]
 
     def _action(self, cluster_id, body):
         """Perform a cluster action, e.g. reset-task."""
@@ -60,15 +132,77 @@ class MgmtClusters(base.ManagerWithFind):
         body = {'reset-task': {}}
         self._action(cluster_id, body)
 
+    def iter_stuck(self, min_age=1800, tasks=None, page_size=None):
+        """Iterate over the clusters with a task other than NONE that
+        were last updated more than min_age seconds ago, optionally only
+        those with one of the task names in tasks.  The clusters are
+        parsed dicts with the age of their task, in seconds, under
+        task_age.
+        """
+        now = time.time()
+        for info in self.iter_index(deleted=False, page_size=page_size,
+                                    raw=True):
+            task = (info.get('task') or {}).get('name')
+            if task in (None, 'NONE') or (tasks and task not in tasks):
+                continue
+            age = now - _timestamp(info.get('updated') or info['created'])
+            if age >= min_age:
+                info['task_age'] = age
+                yield info
+
+    def wait_for(self, clusters, status='NONE', timeout=None,
+                 fail_status=None, **kwargs):
+        """Wait until the task of every one of clusters is status, or one
+        of the task names if a list, or one of fail_status.  The clusters
+        are polled together; the other arguments, such as interval and
+        on_change, are those of :func:`watch`.  A cluster that is not
+        found, e.g. deleted, ends in NOT_FOUND.
+
+        :rtype: dict of the final task name of every cluster ID.
+        """
+        statuses = [status] if isinstance(status, str) else list(status)
+        statuses += list(fail_status or []) + [mgmt_utils.NOT_FOUND]
+
+        def fetch(cluster_id):
+            try:
+                return self.show(cluster_id).task['name']
+            except exceptions.NotFound:
+                return mgmt_utils.NOT_FOUND
+
+        return mgmt_utils.watch(
+            fetch, [base.getid(cluster) for cluster in clusters],
+            lambda current: current in statuses, timeout=timeout, **kwargs)
+
+    def reset_tasks(self, cluster_ids, concurrency=8, timeout=None,
+                    rate=None):
+        """Reset the task of many clusters to NONE in parallel.
 
-def _print_cluster(cluster):
+        :rtype: iterator of :class:`Result`, in completion order.
+        """
+        return mgmt_utils.run_concurrently(
+            self.reset_task, cluster_ids, concurrency=concurrency,
+            timeout=timeout, rate=rate)
+
+
+def _timestamp(value):
+    """Return the seconds since the epoch of a Trove UTC timestamp, e.g.
+    2014-03-01T12:00:00 or 2014-03-01T12:00:00.123456Z.
+    """
+    value = value.rstrip('Z').split('.')[0].replace(' ', 'T')
+    return calendar.timegm(time.strptime(value, '%Y-%m-%dT%H:%M:%S'))
+
+
+def _print_cluster(cluster, fmt='table'):
     if cluster._info.get('links'):
         del(cluster._info['links'])
-    utils.print_dict(cluster._info)
+    mgmt_utils.print_dict(cluster._info, fmt)
 
 
 @utils.arg('cluster', metavar='<cluster>', help='ID of the cluster.')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_cluster_show(cs, args):
     """Show details of a cluster."""
     cluster = cs.management_cluster_python_troveclient_ext.show(args.cluster)
@@ -80,45 +214,178 @@ def do_mgmt_cluster_show(cs, args):
     if hasattr(cluster, 'ip'):
         cluster._info['ip'] = ', '.join(cluster.ip)
     del cluster._info['instances']
-    _print_cluster(cluster)
+    _print_cluster(cluster, args.format)
+
+
+ClusterRow = collections.namedtuple(
+    'ClusterRow', ['id', 'name', 'tenant_id', 'datastore',
+                   'datastore_version', 'task_name', 'created',
+                   'deleted_at'])
+
+
+def _cluster_row(info):
+    """Project the parsed JSON of a cluster onto the mgmt-cluster-list
+    columns.
+    """
+    datastore = info.get('datastore') or {}
+    return ClusterRow(info.get('id'), info.get('name'), info.get('tenant_id'),
+                      datastore.get('type'), datastore.get('version'),
+                      info['task']['name'], info.get('created'),
+                      info.get('deleted_at'))
 
 
 @utils.arg('--deleted', metavar='<deleted>', default=None,
            help='Optional. Filter clusters on deleted.')
+@utils.arg('--stream', action='store_true', default=False,
+           help='Optional. Fetch every page and print each row as it '
+                'arrives instead of printing a table.')
+@utils.arg('--page-size', metavar='<page_size>', type=int, default=None,
+           help='Optional. Number of clusters to fetch per request.')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_cluster_list(cs, args):
     """List all clusters"""
-    clusters = cs.management_cluster_python_troveclient_ext.index(
-        deleted=args.deleted)
-    for cluster in clusters:
-        if hasattr(cluster, 'datastore'):
-            setattr(cluster, 'datastore_version',
-                    cluster.datastore['version'])
-            setattr(cluster, 'datastore', cluster.datastore['type'])
-        setattr(cluster, 'task_name', cluster.task['name'])
-    utils.print_list(clusters,
-                     ['id', 'name', 'tenant_id',
-                      'datastore', 'datastore_version', 'task_name', 'created',
-                      'deleted_at'])
+    ext = cs.management_cluster_python_troveclient_ext
+    if args.stream:
+        clusters = ext.iter_index(deleted=args.deleted,
+                                  page_size=args.page_size, raw=True)
+    else:
+        clusters = ext.index(deleted=args.deleted, limit=args.page_size,
+                             raw=True)
+    mgmt_utils.print_list((_cluster_row(info) for info in clusters),
+                          ClusterRow._fields, args.format, stream=args.stream)
+
+
+DETAIL_FIELDS = ['id', 'name', 'type', 'status', 'host', 'guest_status',
+                 'flavor_id', 'size', 'volume_used', 'volume_used_pct',
+                 'vmRss', 'vmHwm', 'threads', 'mem_total', 'num_cpus',
+                 'error']
+
+
+def _instance_detail(member, fetched, errors):
+    """Merge the cluster stub of an instance with what instance_details
+    fetched for it into one DETAIL_FIELDS dict.
+    """
+    detail = dict((field, None) for field in DETAIL_FIELDS)
+    detail.update(id=member['id'], name=member.get('name'),
+                  type=member.get('type'),
+                  flavor_id=(member.get('flavor') or {}).get('id'),
+                  size=(member.get('volume') or {}).get('size'))
+    info = fetched.get('show') or {}
+    detail['status'] = info.get('status')
+    detail['host'] = info.get('host')
+    detail['guest_status'] = (info.get('guest_status') or {}).get(
+        'state_description')
+    volume = info.get('volume') or {}
+    detail['volume_used'] = volume.get('used')
+    if volume.get('used') is not None and volume.get('size'):
+        detail['volume_used_pct'] = round(
+            100.0 * volume['used'] / volume['size'], 1)
+    for kind in ('diagnostics', 'hwinfo'):
+        detail.update((key, value) for key, value in
+                      (fetched.get(kind) or {}).items()
+                      if key in DETAIL_FIELDS)
+    detail['error'] = '; '.join(errors) or None
+    return detail
 
 
 @utils.arg('cluster', metavar='<cluster>', help='ID of the cluster.')
+@utils.arg('--detail', action='store_true', default=False,
+           help='Optional. Also fetch the details, diagnostics and hardware '
+                'information of every instance, in parallel.')
+@mgmt_utils.concurrency_args
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_cluster_instances(cs, args):
     """Lists all instances of a cluster."""
-    cluster = cs.management_cluster_python_troveclient_ext.show(args.cluster)
+    ext = cs.management_cluster_python_troveclient_ext
+    if args.detail:
+        details = ext.instance_details(args.cluster,
+                                       concurrency=args.concurrency,
+                                       timeout=args.timeout, rate=args.rate)
+        mgmt_utils.print_list(details, DETAIL_FIELDS, args.format,
+                              obj_is_dict=True)
+        failed = [detail for detail in details if detail['error']]
+        for detail in failed:
+            sys.stderr.write("ERROR: %s: %s\n"
+                             % (detail['id'], detail['error']))
+        if failed:
+            raise Exception("%d of %d instances could not be fully "
+                            "fetched." % (len(failed), len(details)))
+        return
+    cluster = ext.show(args.cluster)
     instances = cluster._info['instances']
     for instance in instances:
         instance['flavor_id'] = instance['flavor']['id']
         if instance.get('volume'):
             instance['size'] = instance['volume']['size']
-    utils.print_list(
-        instances, ['id', 'name', 'type', 'flavor_id', 'size'],
+    mgmt_utils.print_list(
+        instances, ['id', 'name', 'type', 'flavor_id', 'size'], args.format,
         obj_is_dict=True)
 
 
 @utils.arg('cluster', metavar='<cluster>', help='ID of the cluster.')
 @utils.service_type('database')
+@mgmt_transport.transport_args
 def do_mgmt_cluster_reset_task(cs, args):
     """Reset the current cluster task to NONE."""
     cs.management_cluster_python_troveclient_ext.reset_task(args.cluster)
+
+
+SWEEP_FIELDS = ['id', 'name', 'tenant_id', 'task_name', 'task_description',
+                'updated', 'stuck_minutes']
+
+
+@utils.arg('--min-age', metavar='<minutes>', type=float, default=30,
+           help='Optional. Only pick clusters whose task has not changed '
+                'for this many minutes (default 30).')
+@utils.arg('--task', metavar='<task>', action='append', default=None,
+           help='Optional. Only pick clusters with this task name. Can be '
+                'repeated.')
+@utils.arg('--page-size', metavar='<page_size>', type=int, default=None,
+           help='Optional. Number of clusters to fetch per request.')
+@utils.arg('--reset', action='store_true', default=False,
+           help='Optional. Reset the task of the stuck clusters to NONE, '
+                'in parallel.')
+@utils.arg('--dry-run', action='store_true', default=False,
+           help='Optional. With --reset, only list the clusters that would '
+                'be reset.')
+@mgmt_utils.concurrency_args
+@utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+def do_mgmt_cluster_sweep(cs, args):
+    """Find the clusters stuck in a task, and optionally reset them"""
+    ext = cs.management_cluster_python_troveclient_ext
+    stuck = []
+    for info in ext.iter_stuck(min_age=args.min_age * 60, tasks=args.task,
+                               page_size=args.page_size):
+        stuck.append({'id': info['id'], 'name': info.get('name'),
+                      'tenant_id': info.get('tenant_id'),
+                      'task_name': info['task']['name'],
+                      'task_description': info['task'].get('description'),
+                      'updated': info.get('updated'),
+                      'stuck_minutes': int(info['task_age'] // 60)})
+    mgmt_utils.print_list(stuck, SWEEP_FIELDS, args.format, obj_is_dict=True)
+    if not args.reset or args.dry_run or not stuck:
+        mgmt_utils.print_summary(
+            "%d clusters stuck for more than %g minutes." % (
+                len(stuck), args.min_age), args.format)
+        return
+
+    start = time.time()
+    failed = mgmt_utils.print_results(
+        ext.reset_tasks([info['id'] for info in stuck],
+                        concurrency=args.concurrency, timeout=args.timeout,
+                        rate=args.rate), args.format)
+    mgmt_utils.print_summary(
+        "Reset %d of %d stuck clusters in %.1f seconds." % (
+            len(stuck) - failed, len(stuck), time.time() - start),
+        args.format)
+    if failed:
+        raise Exception("%d of %d clusters could not be reset." %
+                        (failed, len(stuck)))
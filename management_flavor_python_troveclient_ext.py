@@ -18,6 +18,9 @@ from troveclient import base
 from troveclient import utils
 from troveclient.v1 import flavors
 
+import mgmt_python_troveclient_transport as mgmt_transport
+import mgmt_python_troveclient_utils as mgmt_utils
+
 
 class MgmtFlavor(base.ManagerWithFind):
     """
@@ -76,10 +79,12 @@ class MgmtFlavor(base.ManagerWithFind):
 @utils.arg('--service_type', metavar='<service_type>', default=None,
            help='The service type')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
 def do_mgmt_flavor_create(cs, args):
     """Create a new flavor"""
     ext = cs.management_flavor_python_troveclient_ext
     flavor = ext.create(args.name, args.ram, args.disk, args.vcpus,
                         args.flavorid, args.ephemeral, args.swap,
                         args.rxtx_factor, args.service_type)
-    utils.print_dict(flavor)
+    mgmt_utils.print_dict(flavor, args.format)
@@ -14,11 +14,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import copy
+import sys
+import time
+
 from troveclient import base
 from troveclient import common
+from troveclient import exceptions
 from troveclient import utils
 from troveclient.v1 import instances
 
+import mgmt_python_troveclient_cache as mgmt_cache
+import mgmt_python_troveclient_inventory as mgmt_inventory
+import mgmt_python_troveclient_transport as mgmt_transport
+import mgmt_python_troveclient_utils as mgmt_utils
+
 
 class RootHistory(base.Resource):
     def __repr__(self):
@@ -32,6 +43,10 @@ class Management(base.ManagerWithFind):
     """
     resource_class = instances.Instance
 
+    def __init__(self, api):
+        super(Management, self).__init__(api)
+        self._show_calls = mgmt_utils.SingleFlight()
+
     # Appease the abc gods
     def list(self):
         pass
@@ -39,29 +54,122 @@ class Management(base.ManagerWithFind):
     def show(self, instance):
         """
         Get details of one instance.
+        Concurrent calls for the same instance share one request.
 
         :rtype: :class:`Instance`.
         """
+        instance_id = base.getid(instance)
+        info, shared = self._show_calls.do(instance_id, self._show_info,
+                                           instance_id)
+        if shared:
+            info = copy.deepcopy(info)
+        return self.resource_class(self, info, loaded=True)
+
+    def _show_info(self, instance_id):
+        url = "/mgmt/instances/%s" % instance_id
+        resp, body = self.api.client.get(url)
+        if not body:
+            raise Exception("Call to " + url + " did not return a body.")
+        return body['instance']
+
+    def show_many(self, instances, concurrency=8, ordered=True,
+                  timeout=None, rate=None):
+        """
+        Get details of many instances in parallel, each only once.
+        Results come in the order of instances, or as they complete
+        when ordered is False.
 
-        return self._get("/mgmt/instances/%s" % base.getid(instance),
-                         'instance')
+        :rtype: iterator of :class:`Result` with :class:`Instance` results.
+        """
+        ids = [base.getid(instance) for instance in instances]
+        unique_ids = list(collections.OrderedDict.fromkeys(ids))
+        results = mgmt_utils.run_concurrently(
+            self.show, unique_ids, concurrency=concurrency, timeout=timeout,
+            rate=rate)
+        if ordered:
+            return mgmt_utils.in_order(results, ids)
+        return results
+
+    def wait_for(self, instances, status='ACTIVE', timeout=None,
+                 fail_status=('ERROR',), **kwargs):
+        """
+        Wait until every one of instances has status, or one of the
+        statuses if a list, or one of fail_status.  The instances are
+        polled together; the other arguments, such as interval and
+        on_change, are those of :func:`watch`.  An instance that is not
+        found, e.g. deleted, ends in NOT_FOUND.
 
-    def index(self, deleted=None, limit=None, marker=None):
+        :rtype: dict of the final status of every instance ID.
+        """
+        statuses = [status] if isinstance(status, str) else list(status)
+        statuses += list(fail_status or []) + [mgmt_utils.NOT_FOUND]
+
+        def fetch(instance_id):
+            try:
+                return self.show(instance_id).status
+            except exceptions.NotFound:
+                return mgmt_utils.NOT_FOUND
+
+        return mgmt_utils.watch(
+            fetch, [base.getid(instance) for instance in instances],
+            lambda current: current in statuses, timeout=timeout, **kwargs)
+
+    def index(self, deleted=None, limit=None, marker=None,
+              changes_since=None, raw=False, tenant_id=None, host=None,
+              status=None, datastore=None, datastore_version=None,
+              created_since=None, fields=None):
         """
         Show an overview of all local instances.
-        Optionally, filter by deleted status.
+        Optionally, filter by deleted status, tenant, host, status,
+        datastore type and version or creation time, or ask for only the
+        instances updated since the changes_since timestamp.  The filters
+        are sent to the server and applied again to what it returns, in
+        case it ignored some of them.  fields limits the keys returned for
+        each instance.  With raw, the instances are returned as the parsed
+        dicts.
 
         :rtype: list of :class:`Instance`.
         """
-        form = ''
         if deleted is not None:
             if deleted in ('true', 'True', '1'):
-                form = "?deleted=true"
+                deleted = 'true'
             else:
-                form = "?deleted=false"
+                deleted = 'false'
+
+        filters = dict((key, value) for key, value in (
+            ('tenant_id', tenant_id), ('host', host), ('status', status),
+            ('datastore', datastore), ('datastore_version', datastore_version),
+            ('created_since', created_since)) if value is not None)
+        params = dict(filters)
+        params['changes-since'] = changes_since
+        if fields:
+            # The filters are checked again here, so their keys are needed.
+            params['fields'] = ','.join(sorted(set(fields) | set(
+                _FILTER_KEYS[key] for key in filters)))
+        url = mgmt_utils.build_url("/mgmt/instances", deleted=deleted,
+                                   limit=limit, marker=marker, **params)
+        page = mgmt_utils.paginated_raw(self.api.client, url, "instances")
+        items = page.items
+        if filters or fields:
+            items = [_project(info, fields) for info in items
+                     if _matches(info, filters)]
+        if not raw:
+            items = [self.resource_class(self, info) for info in items]
+        return common.Paginated(items, next_marker=page.next,
+                                links=page.links)
+
+    def iter_index(self, page_size=None, marker=None, **kwargs):
+        """
+        Iterate over all local instances, following the pagination links.
+        Pages of page_size instances are only fetched as they are consumed.
+        The other arguments, such as the filters, are those of index.
 
-        url = "/mgmt/instances%s" % form
-        return self._paginated(url, "instances", limit, marker)
+        :rtype: iterator of :class:`Instance`.
+        """
+        return mgmt_utils.paginate(
+            lambda marker: self.index(limit=page_size, marker=marker,
+                                      **kwargs),
+            marker=marker)
 
     def root_enabled_history(self, instance):
         """
@@ -72,7 +180,22 @@ class Management(base.ManagerWithFind):
         resp, body = self.api.client.get(url)
         if not body:
             raise Exception("Call to " + url + " did not return a body.")
-        return body['root_history']
+        return RootHistory(self, body['root_history'], loaded=True)
+
+    def root_enabled_histories(self, instances=None, concurrency=8,
+                               timeout=None, rate=None, page_size=None):
+        """
+        Get the root access history of many instances in parallel, by
+        default of every instance, streamed from iter_index.
+
+        :rtype: iterator of :class:`Result` with :class:`RootHistory`
+                results, in completion order.
+        """
+        if instances is None:
+            instances = self.iter_index(page_size=page_size, deleted=False)
+        return mgmt_utils.run_concurrently(
+            self.root_enabled_history, instances, concurrency=concurrency,
+            timeout=timeout, rate=rate)
 
     def _action(self, instance_id, body):
         """
@@ -127,18 +250,66 @@ class Management(base.ManagerWithFind):
         body = {'reset-task-status': {}}
         self._action(instance_id, body)
 
+    BULK_ACTIONS = ('stop', 'reboot', 'migrate', 'update',
+                    'reset_task_status')
 
-def _print_instance(instance):
+    def bulk_action(self, action, instance_ids, concurrency=8, timeout=None,
+                    rate=None, **kwargs):
+        """
+        Run one of the BULK_ACTIONS on many instances in parallel.
+        Extra keyword arguments are passed on to the action, e.g. host
+        for migrate.
+
+        :rtype: iterator of :class:`Result`, in completion order.
+        """
+        if action not in self.BULK_ACTIONS:
+            raise Exception("Unsupported bulk action: %s" % action)
+        method = getattr(self, action)
+        return mgmt_utils.run_concurrently(
+            lambda instance_id: method(instance_id, **kwargs), instance_ids,
+            concurrency=concurrency, timeout=timeout, rate=rate)
+
+
+# The key of the instances that each index filter is checked against.
+_FILTER_KEYS = {'tenant_id': 'tenant_id', 'host': 'host', 'status': 'status',
+                'datastore': 'datastore', 'datastore_version': 'datastore',
+                'created_since': 'created'}
+
+
+def _matches(info, filters):
+    datastore = info.get('datastore') or {}
+    for key, value in filters.items():
+        if key == 'created_since':
+            if (info.get('created') or '') < value:
+                return False
+            continue
+        if key == 'datastore':
+            actual = datastore.get('type')
+        elif key == 'datastore_version':
+            actual = datastore.get('version')
+        else:
+            actual = info.get(key)
+        if key == 'status':
+            if (actual or '').upper() != value.upper():
+                return False
+        elif actual != value:
+            return False
+    return True
+
+
+def _project(info, fields):
+    if not fields:
+        return info
+    return dict((key, info[key]) for key in fields if key in info)
+
+
+def _print_instance(instance, fmt='table'):
     if instance._info.get('links'):
         del(instance._info['links'])
-    utils.print_dict(instance._info)
+    mgmt_utils.print_dict(instance._info, fmt)
 
 
-@utils.arg('instance', metavar='<instance>', help='ID of the instance.')
-@utils.service_type('database')
-def do_mgmt_show(cs, args):
-    """Show details of an instance"""
-    instance = cs.management_python_troveclient_ext.show(args.instance)
+def _flatten_show(instance):
     instance._info['flavor'] = instance.flavor['id']
     if hasattr(instance, 'volume') and instance.volume:
         instance._info['volume'] = instance.volume['size']
@@ -157,45 +328,302 @@ def do_mgmt_show(cs, args):
     if hasattr(instance, 'guest_status'):
         description = instance.guest_status['state_description']
         instance._info['guest_status'] = description
-    _print_instance(instance)
+    if instance._info.get('links'):
+        del(instance._info['links'])
+    return instance
+
+
+@utils.arg('instance', metavar='<instance>', nargs='*',
+           help='ID of the instance.')
+@utils.arg('--from-file', metavar='<file>', default=None,
+           help='Optional. File with one instance ID per line, or - for '
+                'stdin.')
+@mgmt_utils.concurrency_args
+@utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
+def do_mgmt_show(cs, args):
+    """Show details of one or more instances"""
+    ext = cs.management_python_troveclient_ext
+    instance_ids = mgmt_utils.read_ids(args.instance, args.from_file)
+    if len(instance_ids) == 1:
+        instance = _flatten_show(ext.show(instance_ids[0]))
+        _print_instance(instance, args.format)
+        return
+
+    failed = []
+
+    def infos():
+        for result in ext.show_many(instance_ids,
+                                    concurrency=args.concurrency,
+                                    timeout=args.timeout, rate=args.rate):
+            if result.error is not None:
+                failed.append(result.item)
+                sys.stderr.write("ERROR: %s: %s\n"
+                                 % (result.item, result.error))
+                continue
+            yield _flatten_show(result.result)._info
+
+    if args.format == 'table':
+        for info in infos():
+            mgmt_utils.print_dict(info)
+    else:
+        mgmt_utils.print_list(infos(), fmt=args.format, obj_is_dict=True)
+    if failed:
+        raise Exception("%d of %d instances could not be shown." %
+                        (len(failed), len(instance_ids)))
+
+
+InstanceRow = collections.namedtuple(
+    'InstanceRow', ['id', 'name', 'tenant_id', 'flavor_id', 'size',
+                    'datastore', 'datastore_version', 'status', 'created',
+                    'deleted_at'])
+
+
+# The keys of the instance JSON that the InstanceRow columns come from.
+_ROW_KEYS = {'flavor_id': 'flavor', 'size': 'volume',
+             'datastore_version': 'datastore'}
+
+
+def _instance_row(info):
+    """Project the parsed JSON of an instance onto the mgmt-list columns."""
+    volume = info.get('volume') or {}
+    datastore = info.get('datastore') or {}
+    return InstanceRow(info.get('id'), info.get('name'), info.get('tenant_id'),
+                       info['flavor']['id'], volume.get('size'),
+                       datastore.get('type'), datastore.get('version'),
+                       info.get('status'), info.get('created'),
+                       info.get('deleted_at'))
 
 
 @utils.arg('--deleted', metavar='<deleted>', default=None,
            help='Optional. Filter instances on deleted.')
+@utils.arg('--tenant', metavar='<tenant>', default=None,
+           help='Optional. Filter instances on tenant ID.')
+@utils.arg('--host', metavar='<host>', default=None,
+           help='Optional. Filter instances on host.')
+@utils.arg('--status', metavar='<status>', default=None,
+           help='Optional. Filter instances on status.')
+@utils.arg('--datastore', metavar='<datastore>', default=None,
+           help='Optional. Filter instances on datastore type.')
+@utils.arg('--datastore-version', metavar='<datastore_version>',
+           default=None,
+           help='Optional. Filter instances on datastore version.')
+@utils.arg('--created-since', metavar='<timestamp>', default=None,
+           help='Optional. Only list instances created at or after this '
+                'time, e.g. 2014-06-01T00:00:00.')
+@utils.arg('--fields', metavar='<fields>', default=None,
+           help='Optional. Comma separated columns to print, out of %s.'
+                % ', '.join(InstanceRow._fields))
+@utils.arg('--stream', action='store_true', default=False,
+           help='Optional. Fetch every page and print each row as it '
+                'arrives instead of printing a table.')
+@utils.arg('--page-size', metavar='<page_size>', type=int, default=None,
+           help='Optional. Number of instances to fetch per request. '
+                'Without --stream or a filter, only the first page is '
+                'listed.')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_list(cs, args):
     """List all instances"""
-    instances = cs.management_python_troveclient_ext.index(deleted=args.deleted)
-    for instance in instances:
-        setattr(instance, 'flavor_id', instance.flavor['id'])
-        if hasattr(instance, 'volume'):
-            setattr(instance, 'size', instance.volume['size'])
-        if hasattr(instance, 'datastore'):
-            setattr(instance, 'datastore_version',
-                    instance.datastore['version'])
-            setattr(instance, 'datastore', instance.datastore['type'])
-    utils.print_list(instances,
-                     ['id', 'name', 'tenant_id', 'flavor_id', 'size',
-                      'datastore', 'datastore_version', 'status', 'created',
-                      'deleted_at'])
+    columns = InstanceRow._fields
+    if args.fields:
+        columns = [column.strip() for column in args.fields.split(',')]
+        unknown = set(columns) - set(InstanceRow._fields)
+        if unknown:
+            raise Exception("Unknown fields: %s" % ', '.join(sorted(unknown)))
+    # Only ask the server for the keys that the columns are built from.
+    keys = sorted(set(_ROW_KEYS.get(column, column) for column in columns) |
+                  set(['flavor']))
+    ext = cs.management_python_troveclient_ext
+    kwargs = dict(deleted=args.deleted, raw=True, tenant_id=args.tenant,
+                  host=args.host, status=args.status,
+                  datastore=args.datastore,
+                  datastore_version=args.datastore_version,
+                  created_since=args.created_since, fields=keys)
+    filtered = any(kwargs[key] is not None for key in _FILTER_KEYS)
+    if args.stream or filtered:
+        # A server ignoring the filters would leave a first page with few
+        # or no matches, so filtered listings go through every page.
+        instances = ext.iter_index(page_size=args.page_size, **kwargs)
+    else:
+        instances = ext.index(limit=args.page_size, **kwargs)
+    mgmt_utils.print_list((_instance_row(info) for info in instances),
+                          columns, args.format, stream=args.stream)
 
 
 @utils.arg('instance', metavar='<instance>', help='ID of the instance.')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_root_history(cs, args):
     """Get the root enabled history of an instance"""
     ext = cs.management_python_troveclient_ext
     history = ext.root_enabled_history(args.instance)
-    utils.print_dict(history)
+    mgmt_utils.print_dict(history._info, args.format)
+
+
+@utils.arg('id', metavar='<id>', nargs='*',
+           help='ID of the instance, or of the cluster with --cluster.')
+@utils.arg('--from-file', metavar='<file>', default=None,
+           help='Optional. File with one ID per line, or - for stdin.')
+@utils.arg('--cluster', action='store_true', default=False,
+           help='Optional. Watch the task of clusters instead of the status '
+                'of instances.')
+@utils.arg('--status', metavar='<status>', action='append', default=None,
+           help='Optional. Status to wait for, ACTIVE by default, or task '
+                'name with --cluster, NONE by default. Can be repeated.')
+@utils.arg('--timeout', metavar='<timeout>', type=float, default=None,
+           help='Optional. Seconds to wait before giving up.')
+@utils.arg('--interval', metavar='<interval>', type=float, default=2,
+           help='Optional. Seconds between polls while things change '
+                '(default 2).')
+@utils.arg('--max-interval', metavar='<seconds>', type=float, default=30,
+           help='Optional. Most seconds between polls while nothing '
+                'changes (default 30).')
+@utils.arg('--concurrency', metavar='<concurrency>', type=int, default=8,
+           help='Optional. Number of IDs to poll at a time (default 8).')
+@utils.service_type('database')
+@mgmt_transport.transport_args
+def do_mgmt_watch(cs, args):
+    """Wait for instances or clusters to reach a status, printing changes"""
+    ids = mgmt_utils.read_ids(args.id, args.from_file)
+    if args.cluster:
+        ext = cs.management_cluster_python_troveclient_ext
+        status = args.status or ['NONE']
+    else:
+        ext = cs.management_python_troveclient_ext
+        status = args.status or ['ACTIVE']
+
+    def on_change(item, old, new):
+        print("%s %s: %s -> %s" % (time.strftime('%H:%M:%S'), item, old,
+                                   new))
+        sys.stdout.flush()
+
+    def on_error(item, error):
+        sys.stderr.write("ERROR: %s: %s\n" % (item, error))
+
+    states = ext.wait_for(ids, status=status, timeout=args.timeout,
+                          interval=args.interval,
+                          max_interval=args.max_interval,
+                          concurrency=args.concurrency, on_change=on_change,
+                          on_error=on_error)
+    failed = [item for item in ids if states[item] not in status]
+    if failed:
+        raise Exception("%d of %d ended up in another status: %s" % (
+            len(failed), len(ids), ', '.join(
+                '%s %s' % (item, states[item]) for item in failed)))
+
+
+ROOT_AUDIT_FIELDS = ['id', 'name', 'tenant_id', 'host', 'root_enabled',
+                     'enabled_at', 'enabled_by', 'error']
+
+
+def _root_audit_record(instance, history=None, error=None):
+    record = dict((field, getattr(instance, field, None))
+                  for field in ('id', 'name', 'tenant_id', 'host'))
+    enabled_at = getattr(history, 'created', None)
+    if enabled_at == 'Never':
+        enabled_at = None
+    record.update(root_enabled=enabled_at is not None, enabled_at=enabled_at,
+                  enabled_by=enabled_at and history.user,
+                  error=error and str(error))
+    return record
+
+
+def _root_audit_filter(args):
+    def keep(record):
+        if record['error']:
+            return True
+        if not args.all and not record['root_enabled']:
+            return False
+        if args.user and record['enabled_by'] not in args.user:
+            return False
+        enabled_at = record['enabled_at'] or ''
+        if args.since and enabled_at < args.since:
+            return False
+        if args.until and enabled_at[:len(args.until)] > args.until:
+            return False
+        return True
+    return keep
+
+
+@utils.arg('--output', metavar='<file>', default=None,
+           help='Optional. File to write to, stdout by default.')
+@utils.arg('--format', metavar='<format>', default=None,
+           choices=mgmt_utils.RECORD_FORMATS,
+           help='Optional. One of csv, tsv, json, jsonl or parquet (needs '
+                'pyarrow). Guessed from the --output extension, csv by '
+                'default.')
+@utils.arg('--all', action='store_true', default=False,
+           help='Optional. Also list the instances root was never enabled '
+                'on.')
+@utils.arg('--user', metavar='<user>', action='append', default=None,
+           help='Optional. Only list root enabled by this user. Can be '
+                'repeated.')
+@utils.arg('--since', metavar='<timestamp>', default=None,
+           help='Optional. Only list root enabled at or after this time, '
+                'e.g. 2014-03 or 2014-03-01T12:00.')
+@utils.arg('--until', metavar='<timestamp>', default=None,
+           help='Optional. Only list root enabled at or before this time, '
+                'e.g. 2014-03.')
+@utils.arg('--sort-by', metavar='<field>', default=None,
+           choices=ROOT_AUDIT_FIELDS,
+           help='Optional. Field to sort on. Records are written as they '
+                'arrive by default.')
+@utils.arg('--reverse', action='store_true', default=False,
+           help='Optional. Sort in descending order.')
+@utils.arg('--page-size', metavar='<page_size>', type=int, default=None,
+           help='Optional. Number of instances to list per request.')
+@mgmt_utils.concurrency_args
+@utils.service_type('database')
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
+def do_mgmt_root_audit(cs, args):
+    """Report which instances had root enabled, when and by whom"""
+    start = time.time()
+    ext = cs.management_python_troveclient_ext
+    instances = ext.iter_index(page_size=args.page_size, deleted=False,
+                               fields=['id', 'name', 'tenant_id', 'host'])
+    failed = []
+
+    def records():
+        for result in ext.root_enabled_histories(
+                instances, concurrency=args.concurrency,
+                timeout=args.timeout, rate=args.rate):
+            record = _root_audit_record(result.item, result.result,
+                                        result.error)
+            if result.error is not None:
+                failed.append(record)
+            yield record
+
+    selected = filter(_root_audit_filter(args), records())
+    if args.sort_by:
+        selected = sorted(selected, reverse=args.reverse,
+                          key=lambda record: (record[args.sort_by] is None,
+                                              record[args.sort_by]))
+    fmt = args.format or mgmt_utils.guess_format(args.output)
+    count = mgmt_utils.write_records(selected, ROOT_AUDIT_FIELDS, fmt,
+                                     args.output)
+    sys.stderr.write("Wrote %d records (%d failed) in %.1f seconds.\n" %
+                     (count, len(failed), time.time() - start))
+    if failed:
+        raise Exception("%d instances could not be audited." % len(failed))
 
 
 @utils.arg('instance', metavar='<instance>', help='ID of the instance.')
+@mgmt_transport.transport_args
 def do_mgmt_stop(cs, args):
     """Stop the database on an instance"""
     cs.management_python_troveclient_ext.stop(args.instance)
 
 
 @utils.arg('instance', metavar='<instance>', help='ID of the instance.')
+@mgmt_transport.transport_args
 def do_mgmt_reboot(cs, args):
     """Soft reboot an instance"""
     cs.management_python_troveclient_ext.reboot(args.instance)
@@ -204,6 +632,7 @@ def do_mgmt_reboot(cs, args):
 @utils.arg('instance', metavar='<instance>', help='ID of the instance.')
 @utils.arg('--host', metavar='<host>', default=None,
            help='Optional. Name of the host.')
+@mgmt_transport.transport_args
 def do_mgmt_migrate(cs, args):
     """Migrate an instance"""
     ext = cs.management_python_troveclient_ext
@@ -211,12 +640,96 @@ def do_mgmt_migrate(cs, args):
 
 
 @utils.arg('instance', metavar='<instance>', help='ID of the instance.')
+@mgmt_transport.transport_args
 def do_mgmt_update(cs, args):
     """Update an instance"""
     cs.management_python_troveclient_ext.update(args.instance)
 
 
 @utils.arg('instance', metavar='<instance>', help='ID of the instance.')
+@mgmt_transport.transport_args
 def do_mgmt_reset_task_status(cs, args):
     """Update the task status to None for an instance"""
     cs.management_python_troveclient_ext.reset_task_status(args.instance)
+
+
+def _bulk_action_args(func):
+    mgmt_utils.format_args(func)
+    mgmt_utils.concurrency_args(func)
+    utils.add_arg(func, '--from-file', metavar='<file>', default=None,
+                  help='Optional. File with one instance ID per line, or '
+                       '- for stdin.')
+    utils.add_arg(func, 'instance', metavar='<instance>', nargs='*',
+                  help='ID of the instance.')
+    return func
+
+
+def _do_bulk_action(cs, args, action, **kwargs):
+    instance_ids = mgmt_utils.read_ids(args.instance, args.from_file)
+    results = cs.management_python_troveclient_ext.bulk_action(
+        action, instance_ids, concurrency=args.concurrency,
+        timeout=args.timeout, rate=args.rate, **kwargs)
+    failed = mgmt_utils.print_results(results, args.format)
+    if failed:
+        raise Exception("%d of %d instances failed." %
+                        (failed, len(instance_ids)))
+
+
+@_bulk_action_args
+@mgmt_transport.transport_args
+def do_mgmt_bulk_stop(cs, args):
+    """Stop the database on many instances in parallel"""
+    _do_bulk_action(cs, args, 'stop')
+
+
+@_bulk_action_args
+@mgmt_transport.transport_args
+def do_mgmt_bulk_reboot(cs, args):
+    """Soft reboot many instances in parallel"""
+    _do_bulk_action(cs, args, 'reboot')
+
+
+@utils.arg('--host', metavar='<host>', default=None,
+           help='Optional. Name of the host.')
+@_bulk_action_args
+@mgmt_transport.transport_args
+def do_mgmt_bulk_migrate(cs, args):
+    """Migrate many instances in parallel"""
+    _do_bulk_action(cs, args, 'migrate', host=args.host)
+
+
+@_bulk_action_args
+@mgmt_transport.transport_args
+def do_mgmt_bulk_update(cs, args):
+    """Update many instances in parallel"""
+    _do_bulk_action(cs, args, 'update')
+
+
+@_bulk_action_args
+@mgmt_transport.transport_args
+def do_mgmt_bulk_reset_task_status(cs, args):
+    """Update the task status to None for many instances in parallel"""
+    _do_bulk_action(cs, args, 'reset_task_status')
+
+
+@utils.arg('--snapshot', metavar='<file>', default=None,
+           help='Optional. Inventory file, by default '
+                '~/.cache/troveclient/inventory.json.')
+@utils.arg('--full', action='store_true', default=False,
+           help='Optional. Refetch everything instead of only the '
+                'instances and clusters updated since the last sync.')
+@utils.arg('--page-size', metavar='<page_size>', type=int, default=None,
+           help='Optional. Number of instances or clusters to fetch per '
+                'request.')
+@utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+def do_mgmt_inventory_sync(cs, args):
+    """Update the local fleet inventory and show what changed"""
+    inventory = mgmt_inventory.Inventory(args.snapshot)
+    changes = inventory.sync(cs, full=args.full, page_size=args.page_size)
+    mgmt_utils.print_list(changes, ['kind', 'id', 'name', 'change', 'old',
+                                    'new'], args.format)
+    mgmt_utils.print_summary("%d added, %d removed, %d changed." % tuple(
+        len([c for c in changes if c.change == change])
+        for change in ('added', 'removed', 'changed')), args.format)
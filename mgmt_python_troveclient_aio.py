@@ -0,0 +1,127 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""asyncio counterparts of the management extension managers.
+
+Usage::
+
+    async with AsyncClient(cs) as aclient:
+        instances = await asyncio.gather(
+            *[aclient.management.show(id) for id in ids])
+
+Every method of a manager of cs becomes a coroutine, run on a pool of
+limit threads shared by all the managers, so the event loop is never
+blocked and at most limit calls are in flight.  Methods returning a
+generator, such as show_many, return its items as a list; the iter_*
+methods become async iterators, fetching a page at a time.
+
+The calls are the managers' own, so they behave the same with
+troveclient's HTTPClient and the keystone SessionClient of the trove
+shell.  Unless cs already has one, a pooled transport with limit
+connections is installed for the lifetime of the AsyncClient, see
+mgmt_python_troveclient_transport.
+"""
+
+import asyncio
+from concurrent import futures
+import functools
+import inspect
+
+import mgmt_python_troveclient_transport as mgmt_transport
+
+_END = object()
+
+
+class AsyncManager(object):
+    """Coroutine versions of the methods of manager, run on executor."""
+
+    def __init__(self, manager, executor):
+        self.manager = manager
+        self.executor = executor
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _call(self, func, *args, **kwargs):
+        def call():
+            result = func(*args, **kwargs)
+            if inspect.isgenerator(result):
+                result = list(result)
+            return result
+        return await self._run(call)
+
+    async def _iterate(self, func, *args, **kwargs):
+        iterator = await self._run(func, *args, **kwargs)
+        while True:
+            item = await self._run(next, iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    def __getattr__(self, name):
+        attr = getattr(self.manager, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        if name.startswith('iter_'):
+            method = functools.partial(self._iterate, attr)
+        else:
+            method = functools.partial(self._call, attr)
+        return functools.update_wrapper(method, attr)
+
+
+class AsyncClient(object):
+    """All the async managers, sharing one pool of threads.
+
+    :param cs: a troveclient Client with the management extensions.
+    :param limit: maximum number of calls, and connections, at once.
+    :param timeout: read timeout of a request in seconds, used when cs
+                    has no transport installed yet.
+    """
+
+    def __init__(self, cs, limit=100, timeout=None):
+        self.cs = cs
+        self.executor = futures.ThreadPoolExecutor(max_workers=limit)
+        self.transport = None
+        if mgmt_transport.installed(cs) is None:
+            self.transport = mgmt_transport.install(
+                cs, mgmt_transport.Transport(pool_size=limit,
+                                             read_timeout=timeout))
+
+        def manager(name):
+            return AsyncManager(getattr(cs, name), self.executor)
+        self.management = manager('management_python_troveclient_ext')
+        self.clusters = manager('management_cluster_python_troveclient_ext')
+        self.hosts = manager('hosts_python_troveclient_ext')
+        self.accounts = manager('accounts_python_troveclient_ext')
+        self.quotas = manager('quota_python_troveclient_ext')
+        self.storage = manager('storage_python_troveclient_ext')
+        self.hwinfo = manager('hwinfo_python_troveclient_ext')
+        self.diagnostics = manager('diagnostics_python_troveclient_ext')
+        self.flavors = manager('management_flavor_python_troveclient_ext')
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+        if self.transport is not None:
+            mgmt_transport.uninstall(self.cs)
+            self.transport = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,398 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Opt-in response cache for the read-only management endpoints.
+
+Usage::
+
+    enable_cache(cs)
+    cs.hosts_python_troveclient_ext.index()  # fetched
+    cs.hosts_python_troveclient_ext.index()  # served from the cache
+
+enable_cache swaps cs.client for a CachingClient, so every manager sees
+the cache without changes.  GETs of the endpoints in the TTL table are
+cached; once an entry expires it is revalidated with If-None-Match when
+the server sent an ETag.  POST, PUT and DELETE requests invalidate the
+cached entries of the collections they touch.
+
+The read-only mgmt-* commands take --cache, --no-cache and --refresh,
+which use a SqliteStore under ~/.cache so that consecutive and
+concurrent CLI runs share their results.
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib import parse
+import zlib
+
+from troveclient import utils
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# (path regex, seconds) pairs, first match wins.  Paths not listed here
+# are never cached.
+DEFAULT_TTLS = (
+    (r'^/mgmt/instances/[^/]+$', 30),
+    (r'^/mgmt/hosts$', 60),
+    (r'^/mgmt/hosts/[^/]+$', 30),
+    (r'^/mgmt/storage$', 60),
+    (r'^/mgmt/accounts$', 60),
+    (r'^/mgmt/quotas/[^/]+$', 300),
+)
+
+# A write to /mgmt/<key>/... invalidates every cached /mgmt/<value>...
+# path, since e.g. hosts and accounts embed the state of their instances.
+INVALIDATES = {
+    'instances': ('instances', 'hosts', 'accounts'),
+    'clusters': ('clusters', 'instances', 'hosts', 'accounts'),
+    'hosts': ('hosts', 'instances'),
+    'quotas': ('quotas',),
+    'flavors': ('flavors',),
+}
+
+
+CacheEntry = collections.namedtuple('CacheEntry', ['expires', 'etag',
+                                                   'data'])
+
+
+def _size(entry):
+    """Return the bytes of data entry takes, as max_bytes counts them."""
+    return len(entry.data.encode('utf-8'))
+
+
+class _StripedLocks(object):
+    """A fixed set of locks keys are hashed onto, so that fetches of the
+    same key are serialized without keeping a lock per key.
+    """
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for i in range(stripes)]
+
+    def lock(self, key):
+        return self._locks[zlib.crc32(key.encode()) % len(self._locks)]
+
+
+class MemoryStore(object):
+    """Thread safe LRU store bounded by entry count and bytes of data."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = _StripedLocks()
+
+    def lock(self, key):
+        """Serialize the fetches of one key, so only one thread misses."""
+        return self._key_locks.lock(key)
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, entry):
+        with self._lock:
+            self._pop(key)
+            size = _size(entry)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (entry, size)
+            self.size += size
+            while (len(self._entries) > self.max_entries or
+                   self.size > self.max_bytes):
+                self._pop(next(iter(self._entries)))
+
+    def delete_prefixes(self, prefixes):
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key.startswith(prefixes)]:
+                self._pop(key)
+
+    def _pop(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+
+
+class SqliteStore(object):
+    """LRU store in a SQLite database that processes can share.
+
+    Readers and writers in different processes are kept consistent by
+    SQLite itself.  lock() additionally takes a POSIX record lock, so
+    that when several processes miss the same key only one of them goes
+    to the server while the others wait and then read its result.
+    """
+
+    def __init__(self, path=None, max_entries=16384,
+                 max_bytes=256 * 1024 * 1024):
+        if path is None:
+            cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+            path = os.path.join(cache_home, 'troveclient', 'mgmt.sqlite')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._key_locks = _StripedLocks()
+        self._lock_file = None
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=60,
+                                 isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS cache ("
+                       "key TEXT PRIMARY KEY, expires REAL, etag TEXT, "
+                       "data TEXT, size INTEGER, accessed REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS cache_accessed "
+                       "ON cache (accessed)")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        db = self._db()
+        row = db.execute("SELECT expires, etag, data FROM cache "
+                         "WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        db.execute("UPDATE cache SET accessed = ? WHERE key = ?",
+                   (time.time(), key))
+        return CacheEntry(*row)
+
+    def set(self, key, entry):
+        size = _size(entry)
+        if size > self.max_bytes:
+            return
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("INSERT OR REPLACE INTO cache VALUES "
+                       "(?, ?, ?, ?, ?, ?)",
+                       (key, entry.expires, entry.etag, entry.data,
+                        size, time.time()))
+            db.execute("DELETE FROM cache WHERE expires < ?",
+                       (time.time() - 3600,))
+            count, size = db.execute(
+                "SELECT COUNT(*), TOTAL(size) FROM cache").fetchone()
+            for evict_key, evict_size in db.execute(
+                    "SELECT key, size FROM cache ORDER BY accessed"
+                    ).fetchall():
+                if count <= self.max_entries and size <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM cache WHERE key = ?", (evict_key,))
+                count -= 1
+                size -= evict_size
+
+    def delete_prefixes(self, prefixes):
+        db = self._db()
+        with db:
+            for prefix in prefixes:
+                db.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?",
+                           (len(prefix), prefix))
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        with self._key_locks.lock(key):
+            if fcntl is None:
+                yield
+                return
+            if self._lock_file is None:
+                self._lock_file = open(self.path + '.lock', 'a')
+            offset = zlib.crc32(key.encode()) % 4096
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX, 1, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_file, fcntl.LOCK_UN, 1, offset)
+
+
+class CachedResponse(object):
+    """Stands in for the response of a request served from the cache."""
+    status_code = 200
+
+    def __init__(self, entry):
+        self.headers = {'ETag': entry.etag} if entry.etag else {}
+        self.text = entry.data
+
+
+class CachingClient(object):
+    """Wrap a troveclient HTTP client, caching GETs of the TTL endpoints.
+
+    Everything but get, post, put and delete is passed straight through
+    to the wrapped client.  Keys are the full management URL, so clients
+    for different endpoints or tenants can share a store.  While refresh
+    is set every key is fetched from the server once and then cached.
+    """
+
+    def __init__(self, client, store=None, ttls=DEFAULT_TTLS):
+        self.client = client
+        self.store = store if store is not None else MemoryStore()
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.refresh = False
+        self.stats = collections.Counter()
+        self._refreshed = set()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _key(self, url):
+        return (getattr(self.client, 'management_url', None) or '') + url
+
+    def _ttl(self, url):
+        path = parse.urlparse(url).path
+        for pattern, ttl in self.ttls:
+            if pattern.match(path):
+                return ttl
+        return None
+
+    def get(self, url, **kwargs):
+        ttl = self._ttl(url)
+        if ttl is None:
+            return self.client.get(url, **kwargs)
+        key = self._key(url)
+        entry = self.store.get(key)
+        if self._fresh(key, entry):
+            self.stats['hit'] += 1
+            return CachedResponse(entry), json.loads(entry.data)
+        with self.store.lock(key):
+            # Another thread or process may have fetched it meanwhile.
+            entry = self.store.get(key)
+            if self._fresh(key, entry):
+                self.stats['hit'] += 1
+                return CachedResponse(entry), json.loads(entry.data)
+            if entry is not None and entry.etag and not self.refresh:
+                headers = dict(kwargs.get('headers') or {})
+                headers['If-None-Match'] = entry.etag
+                kwargs['headers'] = headers
+            resp, body = self.client.get(url, **kwargs)
+            if resp.status_code == 304 and entry is not None:
+                self.stats['revalidated'] += 1
+                entry = entry._replace(expires=time.time() + ttl)
+                self.store.set(key, entry)
+                return CachedResponse(entry), json.loads(entry.data)
+            self.stats['miss'] += 1
+            if resp.status_code == 200 and body is not None:
+                self.store.set(key, CacheEntry(time.time() + ttl,
+                                               resp.headers.get('ETag'),
+                                               json.dumps(body)))
+            if self.refresh:
+                self._refreshed.add(key)
+        return resp, body
+
+    def _fresh(self, key, entry):
+        if entry is None or entry.expires <= time.time():
+            return False
+        # With refresh set, only what this client fetched itself counts.
+        return not self.refresh or key in self._refreshed
+
+    def invalidate(self, url):
+        """Drop the cached entries that a write to url may have changed."""
+        parts = parse.urlparse(url).path.strip('/').split('/')
+        if len(parts) < 2 or parts[0] != 'mgmt':
+            return
+        names = INVALIDATES.get(parts[1], (parts[1],))
+        self.store.delete_prefixes(tuple(
+            self._key('/mgmt/%s' % name) for name in names))
+
+    def post(self, url, **kwargs):
+        try:
+            return self.client.post(url, **kwargs)
+        finally:
+            self.invalidate(url)
+
+    def put(self, url, **kwargs):
+        try:
+            return self.client.put(url, **kwargs)
+        finally:
+            self.invalidate(url)
+
+    def delete(self, url, **kwargs):
+        try:
+            return self.client.delete(url, **kwargs)
+        finally:
+            self.invalidate(url)
+
+
+def enable_cache(cs, store=None, ttls=DEFAULT_TTLS):
+    """Route the requests of cs through a CachingClient and return it."""
+    if not isinstance(cs.client, CachingClient):
+        cs.client = CachingClient(cs.client, store=store, ttls=ttls)
+    return cs.client
+
+
+def disable_cache(cs):
+    """Undo enable_cache."""
+    if isinstance(cs.client, CachingClient):
+        cs.client = cs.client.client
+
+
+@contextlib.contextmanager
+def uncached(cs):
+    """Send the requests of cs straight to the server inside the block."""
+    client = cs.client
+    disable_cache(cs)
+    try:
+        yield
+    finally:
+        cs.client = client
+
+
+def cache_args(func):
+    """Add --cache, --no-cache and --refresh to a mgmt-* command.
+
+    Caching is off by default unless TROVE_MGMT_CACHE is set in the
+    environment.
+    """
+    @functools.wraps(func)
+    def wrapper(cs, args):
+        if not (args.cache or args.refresh):
+            return func(cs, args)
+        client = enable_cache(cs, store=SqliteStore())
+        client.refresh = args.refresh
+        try:
+            return func(cs, args)
+        finally:
+            disable_cache(cs)
+
+    default = bool(utils.env('TROVE_MGMT_CACHE'))
+    utils.add_arg(wrapper, '--refresh', action='store_true', default=False,
+                  help='Optional. Ignore cached responses, fetch fresh ones '
+                       'and cache those.')
+    utils.add_arg(wrapper, '--no-cache', dest='cache', action='store_false',
+                  default=default,
+                  help='Optional. Do not use the response cache.')
+    utils.add_arg(wrapper, '--cache', dest='cache', action='store_true',
+                  default=default,
+                  help='Optional. Use the response cache in '
+                       '~/.cache/troveclient (default: $TROVE_MGMT_CACHE).')
+    return wrapper
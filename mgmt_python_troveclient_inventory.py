@@ -0,0 +1,159 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Local snapshot of the fleet, kept up to date by mgmt-inventory-sync.
+
+Instances and clusters are synced incrementally: the listing asks for
+changes-since the newest 'updated' timestamp seen by the previous sync,
+and only the returned records are merged.  When the server ignores
+changes-since, which shows as records older than the watermark, the
+listing is treated as a full one instead.  Hosts and accounts have no
+timestamps and are always listed in full.  The response cache is
+bypassed, as a cached listing would hide changes from the diff.
+"""
+
+import collections
+import json
+import os
+
+import mgmt_python_troveclient_cache as mgmt_cache
+
+
+Change = collections.namedtuple('Change', ['kind', 'id', 'name', 'change',
+                                           'old', 'new'])
+
+
+def _with_task_name(clusters):
+    for cluster in clusters:
+        cluster.task_name = cluster.task['name']
+        yield cluster
+
+
+# kind: (id field, status field, other fields kept, incremental)
+KINDS = collections.OrderedDict([
+    ('instances', ('id', 'status',
+                   ('name', 'tenant_id', 'host', 'updated'), True)),
+    ('clusters', ('id', 'task_name',
+                  ('name', 'tenant_id', 'updated'), True)),
+    ('hosts', ('name', 'instanceCount', ('name', 'percentUsed'), False)),
+    ('accounts', ('id', 'num_instances', (), False)),
+])
+
+
+def _fetch(cs, kind, since, page_size):
+    if kind == 'instances':
+        return cs.management_python_troveclient_ext.iter_index(
+            page_size=page_size, changes_since=since)
+    if kind == 'clusters':
+        return _with_task_name(
+            cs.management_cluster_python_troveclient_ext.iter_index(
+                page_size=page_size, changes_since=since))
+    if kind == 'hosts':
+        return cs.hosts_python_troveclient_ext.index()
+    return cs.accounts_python_troveclient_ext.index()
+
+
+def _is_deleted(resource):
+    return bool(getattr(resource, 'deleted', False) or
+                getattr(resource, 'deleted_at', None))
+
+
+class Inventory(object):
+    """Records of every instance, cluster, host and account, by kind and id.
+
+    The snapshot is a JSON file, by default in ~/.cache/troveclient.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+            path = os.path.join(cache_home, 'troveclient', 'inventory.json')
+        self.path = path
+        self.records = dict((kind, {}) for kind in KINDS)
+        self.watermarks = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                snapshot = json.load(f)
+            self.records.update(snapshot['records'])
+            self.watermarks = snapshot['watermarks']
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                    exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'records': self.records,
+                       'watermarks': self.watermarks}, f)
+        os.replace(tmp_path, self.path)
+
+    def sync(self, cs, full=False, page_size=None):
+        """Bring the snapshot up to date, save it and return the changes."""
+        changes = []
+        with mgmt_cache.uncached(cs):
+            for kind in KINDS:
+                changes.extend(self._sync_kind(cs, kind, full, page_size))
+        self.save()
+        return changes
+
+    def _sync_kind(self, cs, kind, full, page_size):
+        id_field, status_field, fields, incremental = KINDS[kind]
+        old = self.records[kind]
+        since = None
+        if incremental and not full and old:
+            since = self.watermarks.get(kind)
+        new = dict(old) if since else {}
+        watermark = self.watermarks.get(kind)
+        seen = set()
+        for resource in _fetch(cs, kind, since, page_size):
+            updated = getattr(resource, 'updated', None)
+            if since and updated and updated < since:
+                # changes-since was ignored, so this is a full listing.
+                since = None
+            if updated and (watermark is None or updated > watermark):
+                watermark = updated
+            key = getattr(resource, id_field)
+            seen.add(key)
+            if _is_deleted(resource):
+                new.pop(key, None)
+                continue
+            record = dict((field, getattr(resource, field, None))
+                          for field in fields)
+            record['status'] = getattr(resource, status_field, None)
+            new[key] = record
+        if not since:
+            new = dict((key, record) for key, record in new.items()
+                       if key in seen)
+        self.records[kind] = new
+        if watermark:
+            self.watermarks[kind] = watermark
+        return self._diff(kind, old, new)
+
+    @staticmethod
+    def _diff(kind, old, new):
+        changes = []
+        for key in sorted(set(old) | set(new)):
+            before, after = old.get(key), new.get(key)
+            if before is None:
+                changes.append(Change(kind, key, after.get('name'), 'added',
+                                      None, after['status']))
+            elif after is None:
+                changes.append(Change(kind, key, before.get('name'),
+                                      'removed', before['status'], None))
+            elif before['status'] != after['status']:
+                changes.append(Change(kind, key, after.get('name'),
+                                      'changed', before['status'],
+                                      after['status']))
+        return changes
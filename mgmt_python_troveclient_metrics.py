@@ -0,0 +1,259 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per-request metrics for the management API calls.
+
+Usage::
+
+    timings = Timings()
+    install(cs, Transport(hooks=[timings, StatsdHook()]))
+    cs.hosts_python_troveclient_ext.index()
+    timings.print_summary()
+
+The transport hands a Call to the record method of each of its hooks
+after every request of the client it is installed on, an HTTPClient or
+a keystone SessionClient alike, including failed ones.  Endpoints are reported
+as templates, e.g. /mgmt/instances/{id}/diagnostics, so that calls for
+different instances add up.
+
+The mgmt-* commands take --timings, which prints a Timings summary on
+stderr when the command ends.  Setting TROVE_MGMT_STATSD to host:port,
+TROVE_MGMT_PROMETHEUS_TEXTFILE to a path or TROVE_MGMT_OTEL to 1 adds the
+matching hook to every command.
+"""
+
+import collections
+import os
+import re
+import socket
+import sys
+import threading
+from urllib import parse
+
+from troveclient import utils
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+
+# latency is the time until the response headers came in and decode_time
+# the rest, reading and decoding the body, both in seconds; started is a
+# time.time().
+Call = collections.namedtuple('Call', ['method', 'endpoint', 'status',
+                                       'latency', 'bytes', 'decode_time',
+                                       'started'])
+
+
+def endpoint_template(url):
+    """Return the path of url with the id of the resource replaced by {id}.
+
+    Everything before /mgmt, the endpoint and tenant, is left out.
+    """
+    parts = parse.urlparse(url).path.rstrip('/').split('/')
+    if 'mgmt' not in parts:
+        return '/'.join(parts)
+    parts = parts[parts.index('mgmt'):]
+    if len(parts) > 2 and parts[2] != 'action':
+        parts[2] = '{id}'
+    return '/' + '/'.join(parts)
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1,
+                      int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+SUMMARY_FIELDS = ['method', 'endpoint', 'calls', 'errors', 'total_s',
+                  'mean_ms', 'p95_ms', 'max_ms', 'kb', 'decode_ms']
+
+
+class Timings(object):
+    """Collect every call in memory and summarize them by endpoint."""
+
+    def __init__(self):
+        self.calls = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        with self._lock:
+            self.calls[(call.method, call.endpoint)].append(call)
+
+    def close(self):
+        pass
+
+    def summary(self):
+        """Return one dict per method and endpoint, slowest total first."""
+        with self._lock:
+            groups = list(self.calls.items())
+        rows = []
+        for (method, endpoint), calls in groups:
+            latencies = [call.latency for call in calls]
+            total = sum(latencies)
+            rows.append({
+                'method': method,
+                'endpoint': endpoint,
+                'calls': len(calls),
+                'errors': sum(1 for call in calls
+                              if call.status is None or call.status >= 400),
+                'total_s': round(total, 3),
+                'mean_ms': round(total / len(calls) * 1000, 1),
+                'p95_ms': round(_percentile(latencies, 95) * 1000, 1),
+                'max_ms': round(max(latencies) * 1000, 1),
+                'kb': round(sum(call.bytes for call in calls) / 1024.0, 1),
+                'decode_ms': round(sum(call.decode_time for call in calls) *
+                                   1000, 1),
+            })
+        rows.sort(key=lambda row: row['total_s'], reverse=True)
+        return rows
+
+    def print_summary(self, stream=None):
+        """Print the summary as aligned plain text on stderr, keeping
+        stdout for the output.
+        """
+        stream = stream or sys.stderr
+        rows = [SUMMARY_FIELDS] + [[str(row[field]) for field in
+                                    SUMMARY_FIELDS]
+                                   for row in self.summary()]
+        widths = [max(len(row[column]) for row in rows)
+                  for column in range(len(SUMMARY_FIELDS))]
+        for row in rows:
+            stream.write('  '.join(value.ljust(width) for value, width
+                                   in zip(row, widths)).rstrip() + '\n')
+
+
+def _metric_name(call):
+    return '%s.%s' % (call.endpoint.strip('/').replace('/', '.')
+                      .replace('{id}', 'id'), call.method.lower())
+
+
+class StatsdHook(object):
+    """Send the latency, size and status of every call to statsd over UDP."""
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='troveclient'):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def record(self, call):
+        name = '%s.%s' % (self.prefix, _metric_name(call))
+        lines = ['%s.latency:%.3f|ms' % (name, call.latency * 1000),
+                 '%s.decode:%.3f|ms' % (name, call.decode_time * 1000),
+                 '%s.bytes:%d|c' % (name, call.bytes),
+                 '%s.status.%s:1|c' % (name, call.status or 'error')]
+        try:
+            self._socket.sendto('\n'.join(lines).encode('utf-8'),
+                                self.address)
+        except socket.error:
+            pass
+
+    def close(self):
+        self._socket.close()
+
+
+class PrometheusTextfileHook(object):
+    """Write the calls as Prometheus counters for the node exporter's
+    textfile collector.  On close the counters are added to those already
+    in the file, so they accumulate over runs.
+    """
+
+    def __init__(self, path, prefix='troveclient_mgmt'):
+        self.path = path
+        self.prefix = prefix
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        labels = ('method="%s",endpoint="%s",status="%s"' %
+                  (call.method, call.endpoint, call.status or 'error'))
+        with self._lock:
+            self.counters[('requests_total', labels)] += 1
+            self.counters[('request_seconds_sum', labels)] += call.latency
+            self.counters[('decode_seconds_sum', labels)] += call.decode_time
+            self.counters[('response_bytes_total', labels)] += call.bytes
+
+    def close(self):
+        with self._lock:
+            counters = collections.Counter(self.counters)
+            self.counters.clear()
+        # Other trove processes may be merging into the same file.
+        with open(self.path + '.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._merge(counters)
+
+    def _merge(self, counters):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    match = re.match(r'^%s_(\w+)\{(.*)\} (\S+)$' %
+                                     self.prefix, line.strip())
+                    if match:
+                        counters[match.group(1), match.group(2)] += float(
+                            match.group(3))
+        lines = []
+        for (name, labels), value in sorted(counters.items()):
+            lines.append('%s_%s{%s} %s' % (self.prefix, name, labels,
+                                           repr(float(value))))
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+class OpenTelemetryHook(object):
+    """Report every call as an OpenTelemetry client span."""
+
+    def __init__(self, tracer=None):
+        if trace is None:
+            raise Exception("OpenTelemetry spans require opentelemetry-api.")
+        self.tracer = tracer or trace.get_tracer('troveclient.mgmt')
+
+    def record(self, call):
+        start = int(call.started * 1e9)
+        span = self.tracer.start_span(
+            '%s %s' % (call.method, call.endpoint),
+            kind=trace.SpanKind.CLIENT, start_time=start,
+            attributes={'http.method': call.method,
+                        'http.route': call.endpoint,
+                        'http.status_code': call.status or 0,
+                        'http.response_content_length': call.bytes,
+                        'troveclient.decode_ms': call.decode_time * 1000})
+        span.end(end_time=start + int(call.latency * 1e9))
+
+    def close(self):
+        pass
+
+
+def hooks_from_env():
+    """Return the hooks configured in the environment."""
+    hooks = []
+    statsd = utils.env('TROVE_MGMT_STATSD')
+    if statsd:
+        host, _sep, port = statsd.partition(':')
+        hooks.append(StatsdHook(host or '127.0.0.1', port or 8125))
+    textfile = utils.env('TROVE_MGMT_PROMETHEUS_TEXTFILE')
+    if textfile:
+        hooks.append(PrometheusTextfileHook(textfile))
+    if utils.env('TROVE_MGMT_OTEL'):
+        hooks.append(OpenTelemetryHook())
+    return hooks
@@ -0,0 +1,377 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Pooled HTTP transport for the management extension managers.
+
+Usage::
+
+    install(cs, Transport(pool_size=32, read_timeout=60))
+    cs.hosts_python_troveclient_ext.index()  # reuses one connection
+
+troveclient's HTTPClient sends every request with requests.request(),
+which opens a new session, and so a new TCP and TLS connection, each
+time.  install replaces the request method of such a client with one
+that sends on a long-lived session, so every manager sharing cs gets
+pooled, kept-alive connections without changes.  With http2 set the
+session is an httpx client multiplexing requests over HTTP/2, which needs
+httpx and h2 to be installed.
+
+The SessionClient the trove shell builds on a keystone session already
+sends on a long-lived requests session, which does its auth and endpoint
+lookup; install mounts the pool sized adapter of the transport on it
+instead.  HTTP/2 is not available there.  With either client every
+request is reported to the hooks of the transport, see
+mgmt_python_troveclient_metrics.
+
+The mgmt-* commands take --pool-size, --http2, --no-keep-alive,
+--connect-timeout and --read-timeout, which default to the
+TROVE_MGMT_POOL_SIZE, TROVE_MGMT_HTTP2, TROVE_MGMT_CONNECT_TIMEOUT and
+TROVE_MGMT_READ_TIMEOUT environment variables.
+"""
+
+import collections
+import functools
+import json
+import sys
+import threading
+import time
+
+import requests
+from requests import adapters
+from troveclient import client as trove_client
+from troveclient import exceptions
+from troveclient import utils
+
+import mgmt_python_troveclient_cache as mgmt_cache
+import mgmt_python_troveclient_metrics as mgmt_metrics
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class _Adapter(adapters.HTTPAdapter):
+    """An HTTPAdapter applying the keep-alive and timeouts of a transport
+    to the requests sent through it without a timeout of their own.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        super(_Adapter, self).__init__(pool_connections=transport.pool_size,
+                                       pool_maxsize=transport.pool_size)
+
+    def send(self, request, timeout=None, **kwargs):
+        if not self.transport.keep_alive:
+            request.headers['Connection'] = 'close'
+        if timeout is None:
+            timeout = self.transport._timeout()
+        return super(_Adapter, self).send(request, timeout=timeout, **kwargs)
+
+
+class Transport(object):
+    """A thread safe, pooled HTTP session with keep-alive and timeouts.
+
+    pool_size is the number of connections kept open per host; it should
+    be at least the number of requests made in parallel, or connections
+    beyond it are closed after each request.  Each of hooks is given a
+    mgmt_metrics.Call for every request, see record.
+    """
+
+    def __init__(self, pool_size=10, keep_alive=True, http2=False,
+                 gzip=True, connect_timeout=None, read_timeout=None,
+                 verify=True, hooks=()):
+        if http2 and httpx is None:
+            raise Exception("HTTP/2 requires httpx, install httpx[http2].")
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.http2 = http2
+        self.gzip = gzip
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.verify = verify
+        self.hooks = list(hooks)
+        self.stats = collections.Counter()
+        self._session = None
+        self._adapter = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                if self.http2:
+                    self._session = self._httpx_session()
+                else:
+                    self._session = self._requests_session()
+            return self._session
+
+    def _requests_session(self):
+        session = requests.Session()
+        self._adapter = _Adapter(self)
+        session.mount('http://', self._adapter)
+        session.mount('https://', self._adapter)
+        session.verify = self.verify
+        return session
+
+    def mount(self, session):
+        """Send the requests of session, a requests.Session, through the
+        pooled adapter of this transport.
+        """
+        if self.http2:
+            raise Exception("HTTP/2 is not available with a keystone "
+                            "session, leave out --http2.")
+        with self._lock:
+            if self._adapter is None:
+                self._adapter = _Adapter(self)
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+
+    def _httpx_session(self):
+        keep_alive = self.pool_size if self.keep_alive else 0
+        limits = httpx.Limits(max_connections=self.pool_size,
+                              max_keepalive_connections=keep_alive)
+        try:
+            return httpx.Client(http2=True, limits=limits, verify=self.verify,
+                                timeout=httpx.Timeout(
+                                    self.read_timeout,
+                                    connect=self.connect_timeout))
+        except ImportError:
+            raise Exception("HTTP/2 requires h2, install httpx[http2].")
+
+    def _timeout(self, default=None):
+        connect = self.connect_timeout or default
+        read = self.read_timeout or default
+        if connect is None and read is None:
+            return None
+        return (connect, read)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """Send a request on the pooled session and return the response."""
+        session = self._get_session()
+        headers = dict(kwargs.pop('headers', None) or {})
+        if self.gzip:
+            headers['Accept-Encoding'] = 'gzip, deflate'
+        else:
+            headers['Accept-Encoding'] = 'identity'
+        self.stats['requests'] += 1
+        if self.http2:
+            if 'data' in kwargs:
+                kwargs['content'] = kwargs.pop('data')
+            kwargs.pop('verify', None)
+            if timeout is not None:
+                kwargs['timeout'] = httpx.Timeout(
+                    self.read_timeout or timeout,
+                    connect=self.connect_timeout or timeout)
+            return session.request(method, url, headers=headers, **kwargs)
+        return session.request(method, url, headers=headers,
+                               timeout=self._timeout(timeout), **kwargs)
+
+    def record(self, call):
+        """Pass call on to the hooks; a failing hook fails no request."""
+        for hook in self.hooks:
+            try:
+                hook.record(call)
+            except Exception:
+                pass
+
+    def connections(self):
+        """Return how many connections have been opened, None if unknown."""
+        if self._adapter is None:
+            return None
+        pools = self._adapter.poolmanager.pools
+        return sum(getattr(pools.get(key), 'num_connections', 0)
+                   for key in pools.keys())
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._adapter is not None:
+                self._adapter.close()
+                self._adapter = None
+
+
+def _request(client, transport, url, method, **kwargs):
+    # The same steps as troveclient.client.HTTPClient.request.
+    headers = dict(kwargs.pop('headers', None) or {})
+    headers['User-Agent'] = getattr(client, 'USER_AGENT',
+                                    'python-troveclient')
+    headers['Accept'] = 'application/json'
+    if 'body' in kwargs:
+        headers['Content-Type'] = 'application/json'
+        kwargs['data'] = json.dumps(kwargs.pop('body'))
+    kwargs['headers'] = headers
+    if hasattr(client, 'http_log_req'):
+        client.http_log_req((url, method), kwargs)
+    kwargs.setdefault('verify', getattr(client, 'verify_cert', True))
+    resp = transport.request(method, url,
+                             timeout=getattr(client, 'timeout', None),
+                             **kwargs)
+    if hasattr(client, 'http_log_resp'):
+        client.http_log_resp(resp)
+    body = None
+    if resp.text:
+        try:
+            body = json.loads(resp.text)
+        except ValueError:
+            pass
+    if resp.status_code >= 400:
+        raise exceptions.from_response(resp, body, url)
+    return resp, body
+
+
+def _recorded(transport, request, url, method, **kwargs):
+    # request is the request method of an HTTPClient or SessionClient;
+    # both return the response and its decoded body.
+    endpoint = mgmt_metrics.endpoint_template(url)
+    started = time.time()
+    start = time.perf_counter()
+    try:
+        resp, body = request(url, method, **kwargs)
+    except Exception as e:
+        # The errors of troveclient carry the response, if there was one.
+        resp = getattr(e, 'response', None)
+        transport.record(mgmt_metrics.Call(
+            method, endpoint, getattr(resp, 'status_code', None),
+            time.perf_counter() - start,
+            len(resp.content) if resp is not None else 0, 0.0, started))
+        raise
+    total = time.perf_counter() - start
+    latency = min(total, resp.elapsed.total_seconds())
+    transport.record(mgmt_metrics.Call(method, endpoint, resp.status_code,
+                                       latency, len(resp.content),
+                                       total - latency, started))
+    return resp, body
+
+
+def _http_client(cs):
+    client = cs.client
+    if isinstance(client, mgmt_cache.CachingClient):
+        client = client.client
+    return client
+
+
+def install(cs, transport=None):
+    """Send the requests of cs through transport and return the transport.
+
+    Calling install again replaces the previously installed transport.
+    """
+    client = _http_client(cs)
+    if transport is None:
+        transport = Transport(verify=getattr(client, 'verify_cert', True))
+    previous = getattr(client, 'mgmt_transport', None)
+    if previous is not None and previous is not transport:
+        previous.close()
+    if isinstance(client, trove_client.HTTPClient):
+        request = functools.partial(_request, client, transport)
+    else:
+        # A SessionClient: its keystone session keeps a requests.Session.
+        session = client.session.session
+        if 'mgmt_adapters' not in client.__dict__:
+            client.mgmt_adapters = dict(session.adapters)
+        transport.mount(session)
+        request = functools.partial(type(client).request, client)
+    client.mgmt_transport = transport
+    client.request = functools.partial(_recorded, transport, request)
+    return transport
+
+
+def installed(cs):
+    """Return the transport installed on cs, None if there is none."""
+    return getattr(_http_client(cs), 'mgmt_transport', None)
+
+
+def uninstall(cs):
+    """Undo install."""
+    client = _http_client(cs)
+    transport = client.__dict__.pop('mgmt_transport', None)
+    client.__dict__.pop('request', None)
+    saved = client.__dict__.pop('mgmt_adapters', None)
+    if saved is not None:
+        for prefix, adapter in saved.items():
+            client.session.session.mount(prefix, adapter)
+    if transport is not None:
+        transport.close()
+
+
+def _env_float(name):
+    value = utils.env(name)
+    return float(value) if value else None
+
+
+def transport_args(func):
+    """Add --pool-size, --http2, --no-keep-alive, the timeouts and
+    --timings to a mgmt-* command, and install the transport before it
+    runs.  The hooks of mgmt_metrics.hooks_from_env are installed too.
+    """
+    @functools.wraps(func)
+    def wrapper(cs, args):
+        hooks = mgmt_metrics.hooks_from_env()
+        timings = mgmt_metrics.Timings() if args.timings else None
+        if timings is not None:
+            hooks.append(timings)
+        pool_size = args.pool_size
+        if pool_size is None:
+            pool_size = max(10, getattr(args, 'concurrency', None) or 0)
+        verify = getattr(_http_client(cs), 'verify_cert', True)
+        install(cs, Transport(pool_size=pool_size,
+                              keep_alive=args.keep_alive,
+                              http2=args.http2,
+                              connect_timeout=args.connect_timeout,
+                              read_timeout=args.read_timeout,
+                              verify=verify, hooks=hooks))
+        try:
+            return func(cs, args)
+        finally:
+            # Reporting must not hide the outcome of the command itself.
+            for hook in hooks:
+                try:
+                    hook.close()
+                except Exception as e:
+                    sys.stderr.write("WARNING: %s: %s\n" %
+                                     (type(hook).__name__, e))
+            if timings is not None:
+                try:
+                    timings.print_summary()
+                except Exception as e:
+                    sys.stderr.write("WARNING: Timings: %s\n" % e)
+
+    pool_size = utils.env('TROVE_MGMT_POOL_SIZE')
+    utils.add_arg(wrapper, '--timings', action='store_true', default=False,
+                  help='Optional. Print the number, latency and size of '
+                       'the API calls per endpoint on stderr at the end.')
+    utils.add_arg(wrapper, '--read-timeout', metavar='<seconds>', type=float,
+                  default=_env_float('TROVE_MGMT_READ_TIMEOUT'),
+                  help='Optional. Seconds to wait for a response '
+                       '(default: $TROVE_MGMT_READ_TIMEOUT).')
+    utils.add_arg(wrapper, '--connect-timeout', metavar='<seconds>',
+                  type=float,
+                  default=_env_float('TROVE_MGMT_CONNECT_TIMEOUT'),
+                  help='Optional. Seconds to wait for a connection '
+                       '(default: $TROVE_MGMT_CONNECT_TIMEOUT).')
+    utils.add_arg(wrapper, '--no-keep-alive', dest='keep_alive',
+                  action='store_false', default=True,
+                  help='Optional. Close each connection after its request.')
+    utils.add_arg(wrapper, '--http2', action='store_true',
+                  default=bool(utils.env('TROVE_MGMT_HTTP2')),
+                  help='Optional. Multiplex requests over HTTP/2, requires '
+                       'httpx[http2] (default: $TROVE_MGMT_HTTP2).')
+    utils.add_arg(wrapper, '--pool-size', metavar='<connections>', type=int,
+                  default=int(pool_size) if pool_size else None,
+                  help='Optional. Connections kept open to the API '
+                       '(default: $TROVE_MGMT_POOL_SIZE, or the larger of 10 '
+                       'and --concurrency).')
+    return wrapper
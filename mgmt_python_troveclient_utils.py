@@ -0,0 +1,498 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Helpers shared by the *_python_troveclient_ext modules.
+
+This module is deliberately not named like an extension so that the
+troveclient shell does not try to load it as one.
+"""
+
+import argparse
+import collections
+from concurrent import futures
+import csv
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib import parse
+
+from troveclient import common
+from troveclient import utils
+
+
+def build_url(url, **params):
+    """Append the parameters that are not None to url as a query string."""
+    query = [(key, value) for key, value in sorted(params.items())
+             if value is not None]
+    if not query:
+        return url
+    return "%s?%s" % (url, parse.urlencode(query))
+
+
+def next_marker(links):
+    """Return the marker of the 'next' link of a paginated response."""
+    for link in links:
+        if link['rel'] == 'next':
+            query = parse.urlparse(link['href']).query
+            return dict(parse.parse_qsl(query)).get('marker')
+    return None
+
+
+def paginated_raw(client, url, response_key):
+    """Like Manager._paginated, but the items are the parsed dicts.
+
+    Skipping the Resource objects, and the manager reference and _info
+    copy each of them holds on to, keeps long listings small.
+    """
+    resp, body = client.get(url)
+    if not body:
+        raise Exception("Call to " + url + " did not return a body.")
+    links = body.get('links', [])
+    return common.Paginated(body[response_key],
+                            next_marker=next_marker(links), links=links)
+
+
+def paginate(fetch_page, marker=None):
+    """Yield every item of a paginated listing, one page at a time.
+
+    fetch_page is called with the marker of the page to fetch and must
+    return a :class:`troveclient.common.Paginated`.  The next page is
+    only requested once the caller has consumed the current one.
+    """
+    while True:
+        page = fetch_page(marker)
+        for item in page:
+            yield item
+        if not page.next or page.next == marker:
+            return
+        marker = page.next
+
+
+def read_ids(ids=None, from_file=None):
+    """Return ids followed by the ids listed one per line in from_file.
+
+    Blank lines and lines starting with '#' are skipped, and '-' reads
+    the ids from stdin.
+    """
+    ids = list(ids or [])
+    if from_file:
+        if from_file == '-':
+            lines = sys.stdin.readlines()
+        else:
+            with open(from_file) as f:
+                lines = f.readlines()
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                ids.append(line)
+    if not ids:
+        raise Exception("No IDs given on the command line or in a file.")
+    return ids
+
+
+def positive_int(value):
+    """An argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1: %s" % value)
+    return number
+
+
+def concurrency_args(func):
+    """Add the --concurrency, --timeout and --rate arguments to a command."""
+    utils.add_arg(func, '--rate', metavar='<rate>', type=float, default=None,
+                  help='Optional. Maximum number of requests started per '
+                       'second.')
+    utils.add_arg(func, '--timeout', metavar='<timeout>', type=float,
+                  default=None,
+                  help='Optional. Seconds after which a single request is '
+                       'reported as failed.')
+    utils.add_arg(func, '--concurrency', metavar='<concurrency>', type=int,
+                  default=8,
+                  help='Optional. Number of requests to run in parallel '
+                       '(default 8).')
+    return func
+
+
+class RateLimiter(object):
+    """Space out calls to wait() so no more than rate happen per second."""
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def poll(check, timeout=None, interval=1.0, max_interval=30.0, backoff=1.5,
+         jitter=0.1):
+    """Call check() until it returns something true, and return that.
+
+    The wait between calls starts at interval and grows by backoff up to
+    max_interval, with +/- jitter of randomness so that many pollers do
+    not stay in step.  Raises TimeoutError once timeout seconds passed
+    and a last call at the deadline still returned nothing true.
+    """
+    deadline = time.time() + timeout if timeout else None
+    while True:
+        result = check()
+        if result:
+            return result
+        delay = interval * random.uniform(1 - jitter, 1 + jitter)
+        if deadline is not None and time.time() + delay > deadline:
+            time.sleep(max(0, deadline - time.time()))
+            result = check()
+            if result:
+                return result
+            raise TimeoutError("Timed out after %s seconds." % timeout)
+        time.sleep(delay)
+        interval = min(interval * backoff, max_interval)
+
+
+# The final state that wait_for gives to what no longer exists.
+NOT_FOUND = 'NOT_FOUND'
+
+
+def watch(fetch, items, done, timeout=None, interval=2.0,
+          max_interval=30.0, backoff=1.5, jitter=0.1, concurrency=8,
+          on_change=None, on_error=None):
+    """Poll the states of many items together until they are all done.
+
+    Each round calls fetch(item) in parallel for the items whose state
+    done(state) is not yet true, and on_change(item, old, new) for those
+    whose state changed, with old None on the first round.  A failed
+    fetch leaves the item pending and is passed to on_error(item, error).
+    The wait between rounds grows as in poll, and drops back to interval
+    whenever a state changed, since one change tends to be followed by
+    more.  Returns a dict of the final state of every item, or raises
+    TimeoutError once timeout seconds passed.
+    """
+    deadline = time.time() + timeout if timeout else None
+    states = {}
+    pending = list(collections.OrderedDict.fromkeys(items))
+    delay = interval
+    while True:
+        changed = False
+        for result in run_concurrently(fetch, pending,
+                                       concurrency=concurrency):
+            if result.error is not None:
+                if on_error:
+                    on_error(result.item, result.error)
+                continue
+            old = states.get(result.item)
+            if result.item not in states or old != result.result:
+                changed = True
+                states[result.item] = result.result
+                if on_change:
+                    on_change(result.item, old, result.result)
+        pending = [item for item in pending
+                   if item not in states or not done(states[item])]
+        if not pending:
+            return states
+        delay = interval if changed else min(delay * backoff, max_interval)
+        sleep = delay * random.uniform(1 - jitter, 1 + jitter)
+        if deadline is not None and time.time() + sleep > deadline:
+            raise TimeoutError("Timed out after %s seconds waiting for %s." %
+                               (timeout, ', '.join(pending)))
+        time.sleep(sleep)
+
+
+Result = collections.namedtuple('Result', ['item', 'result', 'error',
+                                           'elapsed'])
+
+
+def run_concurrently(func, items, concurrency=8, timeout=None, rate=None):
+    """Call func(item) for every item on a pool of concurrency threads.
+
+    Yields a :class:`Result` per item in completion order.  Exceptions
+    raised by func are returned in Result.error instead of propagating.
+    A call still running timeout seconds after it started is reported
+    with a TimeoutError; its thread is left to finish in the background
+    and its worker stays busy until then, so hung calls lower the
+    concurrency left for the other items.  Items are pulled from the
+    iterable only as workers become free.
+    """
+    limiter = RateLimiter(rate)
+    started = {}
+
+    def call(index, item):
+        limiter.wait()
+        started[index] = time.time()
+        return func(item)
+
+    executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+    items = enumerate(items)
+    pending = {}
+    # Futures reported as timed out whose calls are still running.
+    stuck = set()
+    exhausted = False
+    try:
+        while True:
+            stuck = set(future for future in stuck if not future.done())
+            while not exhausted and len(pending) + len(stuck) < concurrency:
+                try:
+                    index, item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(call, index, item)] = (index, item)
+            if not pending:
+                if exhausted:
+                    return
+                # Every worker is stuck; wait for one to come free.
+                futures.wait(stuck, return_when=futures.FIRST_COMPLETED)
+                continue
+            done, _ = futures.wait(pending, timeout=timeout and 0.1,
+                                   return_when=futures.FIRST_COMPLETED)
+            now = time.time()
+            for future in done:
+                index, item = pending.pop(future)
+                elapsed = now - started.get(index, now)
+                error = future.exception()
+                if error is not None:
+                    yield Result(item, None, error, elapsed)
+                else:
+                    yield Result(item, future.result(), None, elapsed)
+            if not timeout:
+                continue
+            for future, (index, item) in list(pending.items()):
+                elapsed = now - started.get(index, now)
+                if elapsed > timeout:
+                    del pending[future]
+                    stuck.add(future)
+                    error = TimeoutError("Timed out after %.1f seconds."
+                                         % elapsed)
+                    yield Result(item, None, error, elapsed)
+    finally:
+        executor.shutdown(wait=False)
+
+
+RECORD_FORMATS = ('csv', 'tsv', 'json', 'jsonl', 'parquet')
+OUTPUT_FORMATS = ('table', 'csv', 'tsv', 'json', 'jsonl')
+
+
+def guess_format(path, default='csv'):
+    """Pick a RECORD_FORMATS entry from the extension of path."""
+    if path:
+        ext = os.path.splitext(path)[1].lstrip('.').lower()
+        if ext in RECORD_FORMATS:
+            return ext
+    return default
+
+
+def write_records(records, fields, fmt='csv', path=None):
+    """Write dict records to path, or stdout, and return how many there were.
+
+    Every format but parquet is written row by row as the records arrive.
+    parquet needs pyarrow and a path, and buffers the rows to build the
+    columns.  fields sets the csv/tsv/parquet columns; json and jsonl
+    write every key of each record.
+    """
+    if fmt not in RECORD_FORMATS:
+        raise Exception("Unsupported format: %s" % fmt)
+    if fmt == 'parquet':
+        # Imported here, as pyarrow is slow to import and seldom needed.
+        try:
+            import pyarrow
+            from pyarrow import parquet
+        except ImportError:
+            raise Exception("Writing parquet requires pyarrow.")
+        if not path or path == '-':
+            raise Exception("Writing parquet requires an output file.")
+        rows = list(records)
+        columns = dict((field, [row.get(field) for row in rows])
+                       for field in fields)
+        parquet.write_table(pyarrow.table(columns), path)
+        return len(rows)
+
+    if not path or path == '-':
+        out = sys.stdout
+    else:
+        out = open(path, 'w', newline='')
+    count = 0
+    try:
+        if fmt in ('csv', 'tsv'):
+            writer = csv.DictWriter(out, fields, extrasaction='ignore',
+                                    delimiter=',' if fmt == 'csv' else '\t',
+                                    lineterminator='\n')
+            writer.writeheader()
+        elif fmt == 'json':
+            out.write('[')
+        for record in records:
+            if fmt in ('csv', 'tsv'):
+                writer.writerow(record)
+            elif fmt == 'json':
+                out.write(',\n' if count else '\n')
+                out.write(json.dumps(record, default=str))
+            else:
+                out.write(json.dumps(record, default=str) + '\n')
+            out.flush()
+            count += 1
+        if fmt == 'json':
+            out.write('\n]\n' if count else ']\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return count
+
+
+def format_args(func):
+    """Add the --format argument to a command."""
+    utils.add_arg(func, '--format', metavar='<format>', default='table',
+                  choices=OUTPUT_FORMATS,
+                  help='Optional. Output format, one of table (default), '
+                       'csv, tsv, json or jsonl.')
+    return func
+
+
+def _get_field(obj, field, obj_is_dict=False):
+    field_name = field.lower().replace(' ', '_')
+    if obj_is_dict:
+        return obj.get(field, obj.get(field_name, ''))
+    return getattr(obj, field, getattr(obj, field_name, ''))
+
+
+def print_list(objs, fields=None, fmt='table', obj_is_dict=False,
+               stream=False):
+    """Print objs in fmt, one of OUTPUT_FORMATS.
+
+    table goes through utils.print_list, which needs every row to size
+    the columns, unless stream is set, in which case tab separated rows
+    are printed as they arrive.  The other formats always write row by
+    row.  Without fields, the keys of the first object are the columns.
+    """
+    objs = iter(objs)
+    if fields is None:
+        try:
+            first = next(objs)
+        except StopIteration:
+            if fmt == 'json':
+                print('[]')
+            return
+        objs = itertools.chain([first], objs)
+        fields = sorted(first if obj_is_dict else first._info)
+    records = (dict((field, _get_field(obj, field, obj_is_dict))
+                    for field in fields) for obj in objs)
+    if fmt == 'table' and not stream:
+        utils.print_list(list(records), fields, obj_is_dict=True)
+        return
+    write_records(records, fields, 'tsv' if fmt == 'table' else fmt)
+
+
+def print_dict(d, fmt='table'):
+    """Print the dict, or Resource, d in fmt, one of OUTPUT_FORMATS."""
+    info = getattr(d, '_info', d)
+    if fmt == 'table':
+        utils.print_dict(info)
+        return
+    if fmt == 'json':
+        print(json.dumps(info, indent=4, sort_keys=True, default=str))
+        return
+    write_records([info], sorted(info), fmt)
+
+
+def in_order(results, items):
+    """Yield run_concurrently results in the order of items.
+
+    Each result is yielded as soon as all those before it are, and an
+    item listed more than once gets its result repeated.
+    """
+    done = {}
+    position = 0
+    for result in results:
+        done[result.item] = result
+        while position < len(items) and items[position] in done:
+            yield done[items[position]]
+            position += 1
+
+
+class SingleFlight(object):
+    """Let concurrent callers asking for the same key share one call.
+
+    do() returns the result of the call and whether it was shared, i.e.
+    handed to more than one caller, the one that made the call included.
+    A shared result is the same object for every caller, so copy it
+    before changing it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = futures.Future()
+                call.followers = 0
+            else:
+                call.followers += 1
+        if not leader:
+            return call.result(), True
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result, call.followers > 0
+
+
+def print_results(results, fmt='table'):
+    """Print a summary of run_concurrently results, return the failures.
+
+    Except for table, each result is printed as soon as it arrives.
+    """
+    counts = collections.Counter()
+
+    def rows():
+        for result in results:
+            counts['failed' if result.error is not None else 'ok'] += 1
+            yield {'id': result.item,
+                   'status': 'FAILED' if result.error else 'OK',
+                   'elapsed': '%.2f' % result.elapsed,
+                   'error': result.error or ''}
+
+    print_list(rows(), ['id', 'status', 'elapsed', 'error'], fmt,
+               obj_is_dict=True)
+    print_summary("%d succeeded, %d failed." % (counts['ok'],
+                                                counts['failed']), fmt)
+    return counts['failed']
+
+
+def print_summary(line, fmt='table'):
+    """Print a closing line, on stderr unless it goes below a table."""
+    if fmt == 'table':
+        print(line)
+    else:
+        sys.stderr.write(line + '\n')
@@ -15,11 +15,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import csv
 import json
+import sys
+
 from troveclient import base
 from troveclient import common
 from troveclient import utils
 
+import mgmt_python_troveclient_cache as mgmt_cache
+import mgmt_python_troveclient_transport as mgmt_transport
+import mgmt_python_troveclient_utils as mgmt_utils
+
 
 class Quotas(base.ManagerWithFind):
     """
@@ -40,9 +48,14 @@ class Quotas(base.ManagerWithFind):
         return body['quotas']
 
     def update(self, id, quotas):
-        """Update the quota limits for a tenant"""
+        """
+        Update the quota limits for a tenant.  quotas is a dict of limits,
+        or a JSON string of one.
+        """
         url = "/mgmt/quotas/%s" % id
-        body = {"quotas": json.loads(quotas)}
+        if not isinstance(quotas, dict):
+            quotas = json.loads(quotas)
+        body = {"quotas": quotas}
         resp, body = self.api.client.put(url, body=body)
         common.check_for_exceptions(resp, body, url)
         if not body:
@@ -51,23 +64,234 @@ class Quotas(base.ManagerWithFind):
             raise Exception("Missing key value 'quotas' in response body.")
         return body['quotas']
 
+    def bulk_update(self, quotas, concurrency=8, timeout=None, rate=None,
+                    dry_run=False):
+        """
+        Update the quota limits of many tenants in parallel.  quotas maps
+        tenant IDs to dicts of limits.  The current limits of each tenant
+        are fetched first and only those that differ are sent, so tenants
+        that are already correct are not updated.  With dry_run nothing
+        is updated.
+
+        :rtype: iterator of :class:`Result`, in completion order, whose
+                result maps each changed limit to its (old, new) values.
+        """
+        def update(tenant_id):
+            current = self.show(tenant_id)
+            changes = dict((key, (current.get(key), value))
+                           for key, value in quotas[tenant_id].items()
+                           if current.get(key) != value)
+            if changes and not dry_run:
+                self.update(tenant_id, dict((key, new) for key, (old, new)
+                                            in changes.items()))
+            return changes
+
+        return mgmt_utils.run_concurrently(
+            update, list(quotas), concurrency=concurrency, timeout=timeout,
+            rate=rate)
+
+    def utilization(self, page_size=None, concurrency=8, timeout=None,
+                    rate=None):
+        """
+        Join the accounts, the instances and the quotas of every tenant
+        with instances into one record per tenant, least headroom first.
+        The instances that are not deleted are listed once and counted
+        and summed per tenant, and the quotas are fetched in parallel.
+
+        headroom is the smallest percentage left of the instances and
+        volumes limits, None when neither is limited.  Tenants whose
+        quotas could not be fetched have their error in the record.
+
+        :rtype: list of dict.
+        """
+        accounts = self.api.accounts_python_troveclient_ext.index()
+        volume_used = collections.Counter()
+        instance_count = collections.Counter()
+        for info in self.api.management_python_troveclient_ext.iter_index(
+                page_size=page_size, raw=True, deleted=False,
+                fields=['id', 'tenant_id', 'volume']):
+            instance_count[info['tenant_id']] += 1
+            volume_used[info['tenant_id']] += (
+                (info.get('volume') or {}).get('size') or 0)
+        tenant_ids = sorted(set(account.id for account in accounts) |
+                            set(instance_count))
+
+        records = {}
+        for result in mgmt_utils.run_concurrently(
+                self.show, tenant_ids, concurrency=concurrency,
+                timeout=timeout, rate=rate):
+            quotas = result.result or {}
+            tenant_id = result.item
+            record = {
+                'tenant_id': tenant_id,
+                'instances': instance_count[tenant_id],
+                'instances_limit': quotas.get('instances'),
+                'volume_gb': volume_used[tenant_id],
+                'volumes_limit': quotas.get('volumes'),
+                'error': result.error,
+            }
+            percents = []
+            for used, limit in (('instances', 'instances_limit'),
+                                ('volume_gb', 'volumes_limit')):
+                pct_key = used + '_pct'
+                record[pct_key] = None
+                if record[limit] is not None and record[limit] > 0:
+                    record[pct_key] = round(
+                        100.0 * record[used] / record[limit], 1)
+                    percents.append(record[pct_key])
+            record['headroom'] = (round(100 - max(percents), 1)
+                                  if percents else None)
+            records[tenant_id] = record
+        return sorted(records.values(),
+                      key=lambda record: (record['headroom'] is None,
+                                          record['headroom'],
+                                          record['tenant_id']))
+
     # Appease the abc gods
     def list(self):
         pass
 
 
+def _read_quotas(path):
+    """
+    Read the quota limits per tenant from a csv or jsonl file, or stdin.
+    csv files have a tenant_id column and one column per limit, blank
+    cells are left alone.  Each jsonl line is either a dict of limits
+    with a tenant_id key, or {"tenant_id": ..., "quotas": {...}}.
+    """
+    if path == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(path) as f:
+            lines = f.readlines()
+    quotas = collections.OrderedDict()
+    if mgmt_utils.guess_format(path) in ('json', 'jsonl'):
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            tenant_id = record.pop('tenant_id')
+            quotas.setdefault(tenant_id, {}).update(
+                record.get('quotas', record))
+    else:
+        for row in csv.DictReader(lines):
+            tenant_id = row.pop('tenant_id')
+            quotas.setdefault(tenant_id, {}).update(
+                (key, int(value)) for key, value in row.items()
+                if value not in (None, ''))
+    if not quotas:
+        raise Exception("No quotas found in %s." % path)
+    return quotas
+
+
+def _change_summary(changes):
+    return '; '.join('%s: %s -> %s' % (key, old, new)
+                     for key, (old, new) in sorted(changes.items()))
+
+
 @utils.arg('tenant', metavar='<tenant>', help='ID of the tenant.')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_quota_show(cs, args):
     """Get a list of quota limits for a tenant"""
     hosts = cs.quota_python_troveclient_ext.show(args.tenant)
-    utils.print_dict(hosts)
+    mgmt_utils.print_dict(hosts, args.format)
 
 
 @utils.arg('tenant', metavar='<tenant>', help='ID of the tenant.')
 @utils.arg('quotas', metavar='<quotas>', help='Dict of quotas.')
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
 def do_mgmt_quota_update(cs, args):
     """Update quota limits for a tenant"""
     quotas = cs.quota_python_troveclient_ext.update(args.tenant, args.quotas)
-    utils.print_dict(quotas)
+    mgmt_utils.print_dict(quotas, args.format)
+
+
+@utils.arg('--file', metavar='<file>', required=True,
+           help='File of quota limits per tenant, csv with a tenant_id '
+                'column and one column per limit, or jsonl. - reads csv '
+                'from stdin.')
+@utils.arg('--report', metavar='<file>', default=None,
+           help='Optional. File to write the outcome per tenant to, in the '
+                'format of its extension.')
+@utils.arg('--dry-run', action='store_true', default=False,
+           help='Optional. Only report the changes, do not update.')
+@mgmt_utils.concurrency_args
+@utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+def do_mgmt_quota_bulk_update(cs, args):
+    """Update the quota limits of many tenants in parallel, changing only
+    the limits that differ"""
+    quotas = _read_quotas(args.file)
+    counts = collections.Counter()
+
+    def records():
+        for result in cs.quota_python_troveclient_ext.bulk_update(
+                quotas, concurrency=args.concurrency, timeout=args.timeout,
+                rate=args.rate, dry_run=args.dry_run):
+            if result.error is not None:
+                status = 'FAILED'
+            elif not result.result:
+                status = 'UNCHANGED'
+            else:
+                status = 'WOULD UPDATE' if args.dry_run else 'UPDATED'
+            counts[status] += 1
+            yield {'tenant_id': result.item,
+                   'status': status,
+                   'changes': _change_summary(result.result or {}),
+                   'elapsed': '%.2f' % result.elapsed,
+                   'error': result.error or ''}
+
+    fields = ['tenant_id', 'status', 'changes', 'elapsed', 'error']
+    if args.report:
+        mgmt_utils.write_records(records(), fields,
+                                 mgmt_utils.guess_format(args.report),
+                                 args.report)
+    else:
+        mgmt_utils.print_list(records(), fields, args.format,
+                              obj_is_dict=True)
+    mgmt_utils.print_summary(
+        "%d %s, %d unchanged, %d failed." % (
+            counts['WOULD UPDATE'] + counts['UPDATED'],
+            'to update' if args.dry_run else 'updated',
+            counts['UNCHANGED'], counts['FAILED']),
+        'table' if args.report else args.format)
+    if counts['FAILED']:
+        raise Exception("%d of %d tenants failed." %
+                        (counts['FAILED'], len(quotas)))
+
+
+UTILIZATION_FIELDS = ['tenant_id', 'instances', 'instances_limit',
+                      'instances_pct', 'volume_gb', 'volumes_limit',
+                      'volume_gb_pct', 'headroom']
+
+
+@utils.arg('--page-size', metavar='<page_size>', type=int, default=None,
+           help='Optional. Number of instances to fetch per request.')
+@utils.arg('--limit', metavar='<limit>', type=int, default=None,
+           help='Optional. Only show the tenants with the least headroom.')
+@mgmt_utils.concurrency_args
+@utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
+def do_mgmt_quota_report(cs, args):
+    """Show the quota utilization of every tenant, least headroom first"""
+    records = cs.quota_python_troveclient_ext.utilization(
+        page_size=args.page_size, concurrency=args.concurrency,
+        timeout=args.timeout, rate=args.rate)
+    failed = [record for record in records if record['error']]
+    for record in failed:
+        sys.stderr.write("ERROR: %s: %s\n" % (record['tenant_id'],
+                                              record['error']))
+    records = [record for record in records if not record['error']]
+    mgmt_utils.print_list(records[:args.limit], UTILIZATION_FIELDS,
+                          args.format, obj_is_dict=True)
+    if failed:
+        raise Exception("The quotas of %d of %d tenants could not be "
+                        "fetched." % (len(failed), len(records) + len(failed)))
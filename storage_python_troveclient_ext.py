@@ -17,6 +17,10 @@
 from troveclient import base
 from troveclient import utils
 
+import mgmt_python_troveclient_cache as mgmt_cache
+import mgmt_python_troveclient_transport as mgmt_transport
+import mgmt_python_troveclient_utils as mgmt_utils
+
 
 class Device(base.Resource):
     """
@@ -52,7 +56,10 @@ class StorageInfo(base.ManagerWithFind):
 
 
 @utils.service_type('database')
+@mgmt_utils.format_args
+@mgmt_transport.transport_args
+@mgmt_cache.cache_args
 def do_mgmt_storage_list(cs, args):
     """List all storage devices"""
     storage_list = cs.storage_python_troveclient_ext.index()
-    utils.print_list(storage_list)
+    mgmt_utils.print_list(storage_list, fmt=args.format)
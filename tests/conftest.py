@@ -0,0 +1,108 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Fixtures running the mgmt-* commands against tools/fake_mgmt_api.py.
+
+Needs python-troveclient and requests, like the extension itself: each
+test module skips, with a message, when troveclient is missing.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+import bench_mgmt  # noqa
+import fake_mgmt_api  # noqa
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    """Keep the caller's cache and metrics settings out of the commands."""
+    for name in ('TROVE_MGMT_CACHE', 'TROVE_MGMT_STATSD',
+                 'TROVE_MGMT_PROMETHEUS_TEXTFILE', 'TROVE_MGMT_OTEL'):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def fleet():
+    fleet = fake_mgmt_api.Fleet(120, tenants=8, hosts=4,
+                                migrate_seconds=0.1)
+    # Clusters start out busy, to have something to sweep and watch.
+    for cluster in list(fleet.clusters.values())[:2]:
+        cluster['task'] = {'id': 2, 'name': 'BUILDING',
+                           'description': 'Building the cluster.'}
+    return fleet
+
+
+@pytest.fixture
+def api(fleet):
+    server = fake_mgmt_api.FakeMgmtAPI(fleet).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def cs(api):
+    return bench_mgmt.make_client(api.url)
+
+
+@pytest.fixture
+def session_cs(api):
+    """A client on a keystone session, as the trove shell builds it."""
+    pytest.importorskip('keystoneauth1')
+    return bench_mgmt.make_client(api.url, session=True)
+
+
+def _runner(cs, capsys):
+    def run(name, *argv):
+        func_name = 'do_' + name.replace('-', '_')
+        for module_name in bench_mgmt.EXTENSIONS:
+            module = importlib.import_module(module_name)
+            func = getattr(module, func_name, None)
+            if func is not None:
+                break
+        else:
+            raise AssertionError("No command %s." % name)
+        parser = argparse.ArgumentParser(prog=name)
+        for args, kwargs in getattr(func, 'arguments', []):
+            parser.add_argument(*args, **kwargs)
+        capsys.readouterr()
+        try:
+            func(cs, parser.parse_args([str(arg) for arg in argv]))
+        finally:
+            captured = capsys.readouterr()
+            sys.stderr.write(captured.err)
+        return captured.out
+    return run
+
+
+@pytest.fixture
+def trove(cs, capsys):
+    """Run a mgmt-* command as the trove shell would and return its
+    stdout.  Its stderr is left for capsys.
+    """
+    return _runner(cs, capsys)
+
+
+@pytest.fixture
+def session_trove(session_cs, capsys):
+    """trove, with the commands run on session_cs."""
+    return _runner(session_cs, capsys)
@@ -0,0 +1,99 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('troveclient')
+
+from troveclient import exceptions  # noqa: E402
+
+import mgmt_python_troveclient_aio as mgmt_aio  # noqa: E402
+import mgmt_python_troveclient_transport as mgmt_transport  # noqa: E402
+
+CLIENTS = ['cs', 'session_cs']
+
+
+def _run(cs, coroutine_func, **kwargs):
+    async def main():
+        async with mgmt_aio.AsyncClient(cs, **kwargs) as aclient:
+            return await coroutine_func(aclient)
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('client', CLIENTS)
+def test_show_concurrently(request, api, client):
+    cs = request.getfixturevalue(client)
+    api.latency = 0.1
+    ids = ['inst-%08d' % i for i in range(20)]
+
+    async def show(aclient):
+        return await asyncio.gather(
+            *[aclient.management.show(id) for id in ids])
+    start = time.time()
+    instances = _run(cs, show, limit=20)
+    assert time.time() - start < 1
+    assert [instance.id for instance in instances] == ids
+    assert api.stats['connections'] <= 20
+    assert mgmt_transport.installed(cs) is None
+
+
+@pytest.mark.parametrize('client', CLIENTS)
+def test_iter_index(request, client):
+    cs = request.getfixturevalue(client)
+
+    async def ids(aclient):
+        return [instance.id async for instance in
+                aclient.management.iter_index(page_size=25)]
+    assert sorted(_run(cs, ids)) == ['inst-%08d' % i for i in range(120)]
+
+
+def test_cluster_index_filters_deleted(cs, fleet):
+    deleted = next(iter(fleet.clusters))
+    fleet.clusters[deleted]['deleted'] = True
+
+    async def ids(aclient):
+        page = await aclient.clusters.index(deleted='false')
+        return [cluster.id for cluster in page]
+    assert deleted not in _run(cs, ids)
+
+
+def test_generators_become_lists(cs):
+    async def show_many(aclient):
+        return await aclient.management.show_many(['inst-00000001',
+                                                   'inst-00000002'])
+    results = _run(cs, show_many)
+    assert sorted(result.item for result in results) == ['inst-00000001',
+                                                         'inst-00000002']
+
+
+def test_actions_and_errors(cs, fleet):
+    async def stop(aclient):
+        await aclient.management.stop('inst-00000001')
+        await aclient.management.show('inst-99999999')
+    with pytest.raises(exceptions.NotFound):
+        _run(cs, stop)
+    assert sum(fleet.actions.values()) == 1
+
+
+def test_keeps_an_installed_transport(cs):
+    transport = mgmt_transport.install(cs)
+
+    async def index(aclient):
+        return await aclient.hosts.index()
+    assert len(_run(cs, index)) == 4
+    assert mgmt_transport.installed(cs) is transport
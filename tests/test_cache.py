@@ -0,0 +1,64 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import pytest
+
+pytest.importorskip('troveclient')
+
+import management_python_troveclient_ext as management  # noqa: E402
+import mgmt_python_troveclient_cache as mgmt_cache  # noqa: E402
+import quota_python_troveclient_ext as quota  # noqa: E402
+
+
+def _entry(data):
+    return mgmt_cache.CacheEntry(time.time() + 60, None, data)
+
+
+@pytest.mark.parametrize('store', [
+    lambda tmp_path: mgmt_cache.MemoryStore(max_bytes=10),
+    lambda tmp_path: mgmt_cache.SqliteStore(str(tmp_path / 'cache.sqlite'),
+                                            max_bytes=10),
+])
+def test_max_bytes_counts_encoded_bytes(tmp_path, store):
+    store = store(tmp_path)
+    store.set('ascii', _entry('a' * 10))
+    store.set('accented', _entry('é' * 6))
+    assert store.get('ascii') is not None
+    assert store.get('accented') is None
+
+
+def test_memory_store_evicts_by_bytes():
+    store = mgmt_cache.MemoryStore(max_bytes=10)
+    store.set('a', _entry('é' * 3))
+    store.set('b', _entry('é' * 3))
+    assert store.get('a') is None and store.size == 6
+
+
+@pytest.mark.parametrize('func', [management.do_mgmt_list,
+                                  management.do_mgmt_show,
+                                  quota.do_mgmt_quota_show])
+def test_read_commands_take_cache_flags(func):
+    flags = set(arg for args, kwargs in func.arguments for arg in args)
+    assert {'--cache', '--no-cache', '--refresh'} <= flags
+
+
+@pytest.mark.parametrize('func', [management.do_mgmt_stop,
+                                  management.do_mgmt_bulk_stop,
+                                  quota.do_mgmt_quota_update])
+def test_write_commands_take_no_cache_flags(func):
+    flags = set(arg for args, kwargs in func.arguments for arg in args)
+    assert not flags & {'--cache', '--no-cache', '--refresh'}
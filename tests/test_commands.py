@@ -0,0 +1,359 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Run every mgmt-* command in its default format against the fake API
+and check its output and effects against the fleet.
+"""
+
+import collections
+import json
+
+import pytest
+
+import fake_mgmt_api
+
+pytest.importorskip('troveclient')
+
+
+def _tables(out):
+    """Parse the tables printed in out into lists of dicts by header."""
+    tables = []
+    lines = [''] + out.splitlines()
+    for before, border, line in zip(lines, lines[1:], lines[2:]):
+        if not line.startswith('|'):
+            continue
+        cells = [cell.strip() for cell in line[1:-1].split('|')]
+        if border.startswith('+') and not before.startswith('|'):
+            header = cells
+            tables.append([])
+        else:
+            tables[-1].append(dict(zip(header, cells)))
+    return tables
+
+
+def _rows(out):
+    return _tables(out)[0]
+
+
+def _properties(out):
+    return dict((row['Property'], row['Value']) for row in _rows(out))
+
+
+def _set_status(fleet, status, host=None):
+    for info in fleet.instances.values():
+        if host is None or info['host'] == host:
+            info['status'] = status
+
+
+def test_account_list(trove, fleet):
+    assert _rows(trove('mgmt-account-list')) == [
+        {'ID': tenant_id, 'Num Instances': str(len(ids))}
+        for tenant_id, ids in sorted(fleet.by_tenant.items())]
+
+
+def test_account_show(trove, fleet):
+    properties = _properties(trove('mgmt-account-show', 'tenant-00001'))
+    assert properties['id'] == 'tenant-00001'
+    for instance_id in fleet.by_tenant['tenant-00001']:
+        assert "'%s'" % instance_id in properties['instances']
+
+
+def test_account_show_all_on_host(trove, fleet):
+    rows = _rows(trove('mgmt-account-show', '--all', '--host', 'host-0001'))
+    assert sorted(row['ID'] for row in rows) == sorted(
+        fleet.by_host['host-0001'])
+    assert all(row['Tenant ID'] == fleet.instances[row['ID']]['tenant_id']
+               for row in rows)
+
+
+def test_diagnostics_show(trove, fleet):
+    properties = _properties(trove('mgmt-diagnostics-show', 'inst-00000001'))
+    assert properties['vmHwm'] == '300000'
+    assert properties['threads'] == '12'
+
+
+def test_hwinfo_show(trove):
+    properties = _properties(trove('mgmt-hwinfo-show', 'inst-00000001'))
+    assert properties['hwinfo'] == "{'mem_total': 4096, 'num_cpus': 2}"
+
+
+def test_host_list(trove, fleet):
+    assert _rows(trove('mgmt-host-list')) == [
+        {'Name': name, 'InstanceCount': str(len(ids))}
+        for name, ids in sorted(fleet.by_host.items())]
+
+
+def test_host_show(trove, fleet):
+    properties = _properties(trove('mgmt-host-show', 'host-0001'))
+    assert properties['name'] == 'host-0001'
+    assert properties['percentUsed'] == str(
+        min(100, 2 * len(fleet.by_host['host-0001'])))
+
+
+def test_host_map(trove, fleet):
+    rows = _rows(trove('mgmt-host-map'))
+    assert dict((row['Name'], row['Instances']) for row in rows) == dict(
+        (name, str(len(ids))) for name, ids in fleet.by_host.items())
+
+
+def test_host_map_suggest(trove, fleet):
+    rows = _rows(trove('mgmt-host-map', '--suggest', '--threshold', 50))
+    assert rows
+    for row in rows:
+        assert row['ID'] in fleet.by_host[row['From Host']]
+        assert row['To Host'] in fleet.by_host
+
+
+def test_cluster_list(trove, fleet):
+    rows = _rows(trove('mgmt-cluster-list'))
+    assert [row['ID'] for row in rows] == list(fleet.clusters)
+    assert [row['Task Name'] for row in rows] == [
+        cluster['task']['name'] for cluster in fleet.clusters.values()]
+
+
+def test_cluster_show(trove):
+    properties = _properties(trove('mgmt-cluster-show', 'cluster-000001'))
+    assert properties['id'] == 'cluster-000001'
+    assert properties['task_name'] == 'BUILDING'
+
+
+def test_cluster_instances(trove, fleet):
+    rows = _rows(trove('mgmt-cluster-instances', 'cluster-000001'))
+    assert [row['ID'] for row in rows] == [
+        member['id'] for member in fleet.clusters['cluster-000001'][
+            'instances']]
+
+
+def test_cluster_instances_detail(trove, fleet):
+    rows = _rows(trove('mgmt-cluster-instances', 'cluster-000001',
+                       '--detail'))
+    assert len(rows) == 3
+    for row in rows:
+        info = fleet.instances[row['ID']]
+        assert (row['Status'], row['Host']) == (info['status'], info['host'])
+
+
+def test_cluster_sweep(trove, fleet):
+    out = trove('mgmt-cluster-sweep')
+    assert [row['ID'] for row in _rows(out)] == ['cluster-000000',
+                                                 'cluster-000001']
+    assert fleet.clusters['cluster-000000']['task']['name'] == 'BUILDING'
+
+
+def test_cluster_sweep_reset(trove, fleet):
+    out = trove('mgmt-cluster-sweep', '--reset')
+    assert 'Reset 2 of 2 stuck clusters' in out
+    assert all(cluster['task']['name'] == 'NONE'
+               for cluster in fleet.clusters.values())
+    assert fleet.actions == {('clusters', 'reset-task'): 2}
+
+
+def test_cluster_reset_task(trove, fleet):
+    trove('mgmt-cluster-reset-task', 'cluster-000000')
+    assert fleet.clusters['cluster-000000']['task']['name'] == 'NONE'
+    assert fleet.clusters['cluster-000001']['task']['name'] == 'BUILDING'
+
+
+def test_show(trove, fleet):
+    properties = _properties(trove('mgmt-show', 'inst-00000001'))
+    info = fleet.instances['inst-00000001']
+    assert (properties['id'], properties['name'], properties['status']) == (
+        info['id'], info['name'], info['status'])
+
+
+def test_show_many(trove):
+    tables = _tables(trove('mgmt-show', 'inst-00000001', 'inst-00000002'))
+    assert [dict((row['Property'], row['Value']) for row in table)['id']
+            for table in tables] == ['inst-00000001', 'inst-00000002']
+
+
+def test_list(trove, fleet):
+    rows = _rows(trove('mgmt-list'))
+    assert [row['ID'] for row in rows] == list(
+        fleet.instances)[:fake_mgmt_api.DEFAULT_LIMIT]
+
+
+def test_list_filtered(trove, fleet):
+    rows = _rows(trove('mgmt-list', '--host', 'host-0001', '--fields',
+                       'id,status'))
+    assert rows == [{'ID': id, 'Status': fleet.instances[id]['status']}
+                    for id in fleet.by_host['host-0001']]
+
+
+def test_empty_listing_as_json(trove):
+    out = trove('mgmt-list', '--host', 'no-such-host', '--format', 'json')
+    assert json.loads(out) == []
+
+
+def test_root_history(trove, fleet):
+    properties = _properties(trove('mgmt-root-history', 'inst-00000007'))
+    assert properties == fleet.root_history('inst-00000007')
+
+
+def test_root_audit(trove, fleet):
+    lines = trove('mgmt-root-audit', '--user', 'admin1').splitlines()
+    assert [line.split(',')[0] for line in lines[1:]] == [
+        id for id in fleet.instances
+        if fleet.root_history(id)['user'] == 'admin1']
+
+
+def test_quota_show(trove):
+    assert _properties(trove('mgmt-quota-show', 'tenant-00001')) == dict(
+        (key, str(value))
+        for key, value in fake_mgmt_api.DEFAULT_QUOTAS.items())
+
+
+def test_quota_update(trove, fleet):
+    properties = _properties(trove('mgmt-quota-update', 'tenant-00001',
+                                   '{"instances": 20}'))
+    assert properties['instances'] == '20'
+    assert fleet.quotas['tenant-00001']['instances'] == 20
+    assert 'tenant-00002' not in fleet.quotas
+
+
+def test_quota_report(trove, fleet):
+    rows = _rows(trove('mgmt-quota-report'))
+    assert dict((row['Tenant ID'], row['Instances']) for row in rows) == dict(
+        (tenant_id, str(len(ids)))
+        for tenant_id, ids in fleet.by_tenant.items())
+
+
+def test_quota_bulk_update(trove, fleet, tmp_path):
+    path = tmp_path / 'quotas.csv'
+    path.write_text('tenant_id,instances\ntenant-00001,30\n'
+                    'tenant-00002,40\n')
+    assert '2 updated, 0 unchanged, 0 failed.' in trove(
+        'mgmt-quota-bulk-update', '--file', path)
+    assert fleet.quotas['tenant-00001']['instances'] == 30
+    assert fleet.quotas['tenant-00002']['instances'] == 40
+
+
+def test_storage_list(trove):
+    rows = _rows(trove('mgmt-storage-list'))
+    assert [(row['Name'], row['Type'], row['Used']) for row in rows] == [
+        ('ceph', 'ceph', '1024')]
+
+
+def test_flavor_create(trove, fleet):
+    properties = _properties(trove('mgmt-flavor-create', 'm1.test', 2048,
+                                   10, 2))
+    flavor = fleet.flavors[properties['id']]
+    assert (flavor['name'], flavor['ram'], flavor['disk'],
+            flavor['vcpu']) == ('m1.test', '2048', '10', '2')
+
+
+@pytest.mark.parametrize('name, action', [
+    ('mgmt-stop', 'stop'),
+    ('mgmt-reboot', 'reboot'),
+    ('mgmt-migrate', 'migrate'),
+    ('mgmt-update', 'update'),
+    ('mgmt-reset-task-status', 'reset-task-status'),
+])
+def test_instance_action(trove, fleet, name, action):
+    trove(name, 'inst-00000001')
+    assert fleet.actions == {('instances', action): 1}
+
+
+@pytest.mark.parametrize('name, action', [
+    ('mgmt-bulk-stop', 'stop'),
+    ('mgmt-bulk-reboot', 'reboot'),
+    ('mgmt-bulk-update', 'update'),
+    ('mgmt-bulk-reset-task-status', 'reset-task-status'),
+])
+def test_bulk_action(trove, fleet, name, action):
+    out = trove(name, 'inst-00000001', 'inst-00000002')
+    assert [(row['ID'], row['Status']) for row in _rows(out)] == [
+        ('inst-00000001', 'OK'), ('inst-00000002', 'OK')]
+    assert fleet.actions == {('instances', action): 2}
+
+
+def test_bulk_migrate(trove, fleet):
+    trove('mgmt-bulk-migrate', 'inst-00000001', 'inst-00000002', '--host',
+          'host-0002')
+    assert fleet.actions == {('instances', 'migrate'): 2}
+    assert fleet.instances['inst-00000001']['host'] == 'host-0002'
+    assert 'inst-00000002' in fleet.by_host['host-0002']
+
+
+def test_timings(trove, capsys):
+    trove('mgmt-list', '--timings')
+    assert '/mgmt/instances' in capsys.readouterr().err
+
+
+def test_diagnostics_collect(trove, tmp_path):
+    path = tmp_path / 'diagnostics.jsonl'
+    trove('mgmt-diagnostics-collect', '--status', 'any', '--output', path)
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 120
+    assert all(record['vmHwm'] == 300000 for record in records)
+
+
+def test_host_update_all(trove, fleet):
+    trove('mgmt-host-update-all', 'host-0001')
+    assert fleet.actions == {('hosts', 'update'): 1}
+
+
+def test_host_rolling_update(trove, fleet):
+    _set_status(fleet, 'ACTIVE')
+    out = trove('mgmt-host-rolling-update', 'host-0001', 'host-0002',
+                '--interval', '0.05')
+    assert '2 succeeded, 0 failed.' in out
+    assert fleet.actions == {('hosts', 'update'): 2}
+
+
+def test_host_rolling_update_keeps_shutdown_instances(trove, fleet):
+    _set_status(fleet, 'ACTIVE')
+    shutdown = next(iter(fleet.by_host['host-0001']))
+    fleet.instances[shutdown]['status'] = 'SHUTDOWN'
+    out = trove('mgmt-host-rolling-update', 'host-0001', '--interval',
+                '0.05', '--timeout', 5)
+    assert '1 succeeded, 0 failed.' in out
+    assert fleet.instances[shutdown]['status'] == 'SHUTDOWN'
+
+
+def test_wait_until_healthy_compares_with_before(cs, fleet):
+    _set_status(fleet, 'ACTIVE', host='host-0001')
+    shutdown = next(iter(fleet.by_host['host-0001']))
+    fleet.instances[shutdown]['status'] = 'SHUTDOWN'
+    hosts = cs.hosts_python_troveclient_ext
+    hosts.wait_until_healthy('host-0001', timeout=1, interval=0.05,
+                             before={shutdown: 'SHUTDOWN'})
+    with pytest.raises(TimeoutError):
+        hosts.wait_until_healthy('host-0001', timeout=0.3, interval=0.05,
+                                 before={shutdown: 'ACTIVE'})
+
+
+def test_host_evacuate(trove, fleet):
+    _set_status(fleet, 'ACTIVE')
+    ids = list(fleet.by_host['host-0001'])
+    out = trove('mgmt-host-evacuate', 'host-0001', '--concurrency', 8,
+                '--interval', '0.05', '--target-hosts', 'host-0002')
+    assert '%d succeeded, 0 failed.' % len(ids) in out
+    assert not fleet.by_host['host-0001']
+    assert all(fleet.instances[id]['host'] == 'host-0002' for id in ids)
+    assert collections.Counter(
+        fleet.instances[id]['status'] for id in ids) == {'ACTIVE': len(ids)}
+
+
+def test_watch(trove, fleet):
+    _set_status(fleet, 'ACTIVE')
+    fleet.migrate('inst-00000001')
+    out = trove('mgmt-watch', 'inst-00000001', '--interval', '0.05')
+    assert 'inst-00000001: MIGRATE -> ACTIVE' in out
+
+
+def test_watch_not_found(trove):
+    with pytest.raises(Exception, match='NOT_FOUND'):
+        trove('mgmt-watch', 'inst-99999999', '--interval', '0.05')
@@ -0,0 +1,96 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+import types
+
+import pytest
+
+pytest.importorskip('troveclient')
+
+import diagnostics_python_troveclient_ext as diagnostics  # noqa: E402
+
+
+def test_sample_prints_table(trove):
+    out = trove('mgmt-diagnostics-sample', 'inst-00000000', 'inst-00000001',
+                '--interval', '0.05', '--samples', 3)
+    assert '| Slope Per Hour |' in out
+    rows = [line for line in out.splitlines() if 'inst-0000000' in line]
+    assert len(rows) == 2 * len(diagnostics.SAMPLE_METRICS)
+
+
+def test_sample_store_carries_on(trove, tmp_path):
+    argv = ('inst-00000000', '--interval', '0.05', '--metric', 'vmRss',
+            '--store', tmp_path, '--format', 'csv')
+    trove('mgmt-diagnostics-sample', '--samples', 2, *argv)
+    out = trove('mgmt-diagnostics-sample', '--samples', 1, *argv)
+    assert out.splitlines()[1].startswith('inst-00000000,vmRss,3,')
+
+
+@pytest.mark.parametrize('argv', [('--metric', 'vmHwm'),
+                                  ('--metric', 'vmRss', '--capacity', 10)])
+def test_sample_store_refuses_other_layout(trove, tmp_path, argv):
+    trove('mgmt-diagnostics-sample', 'inst-00000000', '--samples', 1,
+          '--metric', 'vmRss', '--store', tmp_path)
+    with pytest.raises(Exception, match='holds 360 samples of vmRss'):
+        trove('mgmt-diagnostics-sample', 'inst-00000000', '--samples', 1,
+              '--store', tmp_path, *argv)
+
+
+def test_sample_fails_when_an_instance_fails(trove):
+    with pytest.raises(Exception, match='1 of 2 instances'):
+        trove('mgmt-diagnostics-sample', 'inst-00000000', 'inst-99999999',
+              '--interval', '0.05', '--samples', 2)
+
+
+def _interrupt(seconds):
+    raise KeyboardInterrupt()
+
+
+def test_sample_interrupted_summarizes_the_samples_taken(trove, monkeypatch):
+    monkeypatch.setattr(diagnostics, 'time', types.SimpleNamespace(
+        time=time.time, sleep=_interrupt))
+    out = trove('mgmt-diagnostics-sample', 'inst-00000000', '--interval',
+                '10', '--metric', 'vmRss', '--format', 'csv')
+    assert out.splitlines()[1].startswith('inst-00000000,vmRss,1,')
+
+
+def test_sample_lets_the_interrupt_through(cs, monkeypatch):
+    monkeypatch.setattr(diagnostics, 'time', types.SimpleNamespace(
+        time=time.time, sleep=_interrupt))
+    with pytest.raises(KeyboardInterrupt):
+        cs.diagnostics_python_troveclient_ext.sample(['inst-00000000'])
+
+
+def test_open_buffers_closes_them_on_failure(tmp_path, monkeypatch):
+    (tmp_path / 'inst-00000001.ring').write_bytes(b'not a sample file\n')
+    closed = []
+    monkeypatch.setattr(diagnostics.RingBuffer, 'close',
+                        lambda ring: closed.append(ring.path))
+    with pytest.raises(Exception, match='is not a sample file'):
+        diagnostics.open_buffers(['inst-00000000', 'inst-00000001'],
+                                 store=str(tmp_path))
+    assert closed == [str(tmp_path / 'inst-00000000.ring')]
+
+
+def test_ring_buffer_keeps_the_last_samples():
+    ring = diagnostics.RingBuffer(['a', 'b'], capacity=4)
+    for second in range(1, 7):
+        ring.append(second, [second * 10, None])
+    summary = dict((row['metric'], row) for row in ring.summary())
+    assert len(ring) == 4
+    assert summary['a']['min'] == 30 and summary['a']['last'] == 60
+    assert summary['a']['slope_per_hour'] == pytest.approx(36000)
+    assert summary['b'] == {'metric': 'b', 'samples': 0}
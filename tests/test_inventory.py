@@ -0,0 +1,58 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import pytest
+
+pytest.importorskip('troveclient')
+
+import mgmt_python_troveclient_cache as mgmt_cache  # noqa: E402
+import mgmt_python_troveclient_inventory as mgmt_inventory  # noqa: E402
+
+UPDATED = '2030-01-01T00:00:00'
+
+
+def _change_status(fleet, instance_id):
+    info = fleet.instances[instance_id]
+    old = info['status']
+    info['status'] = 'SHUTDOWN' if old != 'SHUTDOWN' else 'ACTIVE'
+    info['updated'] = UPDATED
+    return old, info['status']
+
+
+@pytest.mark.parametrize('changes_since', [True, False])
+def test_sync_reports_what_changed(trove, fleet, tmp_path, changes_since):
+    fleet.changes_since = changes_since
+    argv = ('--snapshot', tmp_path / 'inventory.json', '--format', 'csv')
+    rows = trove('mgmt-inventory-sync', *argv).splitlines()[1:]
+    assert len(rows) == 120 + 4 + 4 + 8
+    assert all(',added,' in row for row in rows)
+    old, new = _change_status(fleet, 'inst-00000005')
+    rows = trove('mgmt-inventory-sync', *argv).splitlines()[1:]
+    assert rows == ['instances,inst-00000005,db5,changed,%s,%s' % (old, new)]
+    inventory = mgmt_inventory.Inventory(str(tmp_path / 'inventory.json'))
+    assert inventory.watermarks['instances'] == UPDATED
+
+
+def test_sync_bypasses_the_cache(cs, fleet, tmp_path):
+    mgmt_cache.enable_cache(cs, store=mgmt_cache.MemoryStore())
+    inventory = mgmt_inventory.Inventory(str(tmp_path / 'inventory.json'))
+    inventory.sync(cs)
+    cs.hosts_python_troveclient_ext.index()
+    fleet.migrate('inst-00000001', 'host-0000'
+                  if fleet.instances['inst-00000001']['host'] != 'host-0000'
+                  else 'host-0001')
+    changes = inventory.sync(cs)
+    assert sorted(change.kind for change in changes) == ['hosts', 'hosts']
+    assert isinstance(cs.client, mgmt_cache.CachingClient)
@@ -0,0 +1,70 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import pytest
+
+pytest.importorskip('troveclient')
+
+import mgmt_python_troveclient_metrics as mgmt_metrics  # noqa: E402
+
+CLIENTS = ['trove', 'session_trove']
+
+
+def _timings(err):
+    lines = err.splitlines()
+    header = lines[0].split()
+    assert header == mgmt_metrics.SUMMARY_FIELDS
+    return dict(((row['method'], row['endpoint']), row) for row in
+                [dict(zip(header, line.split())) for line in lines[1:]])
+
+
+@pytest.mark.parametrize('client', CLIENTS)
+def test_timings(request, capsys, client):
+    trove = request.getfixturevalue(client)
+    trove('mgmt-show', 'inst-00000001', 'inst-00000002', '--timings')
+    rows = _timings(capsys.readouterr().err)
+    assert list(rows) == [('GET', '/mgmt/instances/{id}')]
+    row = rows['GET', '/mgmt/instances/{id}']
+    assert row['calls'] == '2' and row['errors'] == '0'
+    assert float(row['kb']) > 0
+
+
+@pytest.mark.parametrize('client', CLIENTS)
+def test_timings_count_errors(request, capsys, client):
+    trove = request.getfixturevalue(client)
+    with pytest.raises(Exception):
+        trove('mgmt-show', 'inst-99999999', '--timings')
+    row = _timings(capsys.readouterr().err)['GET', '/mgmt/instances/{id}']
+    assert row['calls'] == '1' and row['errors'] == '1'
+
+
+@pytest.mark.parametrize('client', CLIENTS)
+def test_prometheus_textfile(request, monkeypatch, tmp_path, client):
+    trove = request.getfixturevalue(client)
+    path = tmp_path / 'trove.prom'
+    monkeypatch.setenv('TROVE_MGMT_PROMETHEUS_TEXTFILE', str(path))
+    trove('mgmt-host-list')
+    trove('mgmt-host-list')
+    trove('mgmt-show', 'inst-00000001')
+    counters = dict(line.rsplit(' ', 1)
+                    for line in path.read_text().splitlines())
+    hosts = 'method="GET",endpoint="/mgmt/hosts",status="200"'
+    show = 'method="GET",endpoint="/mgmt/instances/{id}",status="200"'
+    assert counters['troveclient_mgmt_requests_total{%s}' % hosts] == '2.0'
+    assert counters['troveclient_mgmt_requests_total{%s}' % show] == '1.0'
+    assert float(counters[
+        'troveclient_mgmt_response_bytes_total{%s}' % hosts]) > 0
+    assert float(counters[
+        'troveclient_mgmt_request_seconds_sum{%s}' % hosts]) > 0
@@ -0,0 +1,58 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import pytest
+
+pytest.importorskip('troveclient')
+
+import mgmt_python_troveclient_transport as mgmt_transport  # noqa: E402
+
+
+@pytest.mark.parametrize('argv, expected', [
+    (['mgmt-host-list'], 'host-0003'),
+    (['mgmt-show', 'inst-00000001'], 'inst-00000001'),
+    (['mgmt-list'], 'inst-00000000'),
+])
+def test_session_client_commands(session_trove, argv, expected):
+    assert expected in session_trove(*argv)
+
+
+@pytest.mark.parametrize('client', ['cs', 'session_cs'])
+def test_connections_are_reused(request, api, client):
+    cs = request.getfixturevalue(client)
+    transport = mgmt_transport.install(cs, mgmt_transport.Transport())
+    for _ in range(5):
+        cs.hosts_python_troveclient_ext.index()
+    assert transport.connections() == 1
+    assert api.stats['connections'] == 1
+
+
+@pytest.mark.parametrize('client', ['cs', 'session_cs'])
+def test_no_keep_alive(request, api, client):
+    cs = request.getfixturevalue(client)
+    mgmt_transport.install(cs, mgmt_transport.Transport(keep_alive=False))
+    for _ in range(3):
+        cs.hosts_python_troveclient_ext.index()
+    assert api.stats['connections'] == 3
+
+
+def test_uninstall_restores_the_session_adapters(session_cs):
+    session = session_cs.client.session.session
+    adapters = dict(session.adapters)
+    mgmt_transport.install(session_cs)
+    mgmt_transport.install(session_cs)
+    assert session.adapters['http://'] is not adapters['http://']
+    mgmt_transport.uninstall(session_cs)
+    assert dict(session.adapters) == adapters
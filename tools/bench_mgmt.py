@@ -0,0 +1,351 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the management managers and mgmt-* commands.
+
+Usage::
+
+    python tools/bench_mgmt.py --sizes 10,1000,100000
+    python tools/bench_mgmt.py --scenarios 'iter_index|mgmt-list' \\
+        --transport none,pooled --latency 0.005 --format csv
+
+For each fleet size a FakeMgmtAPI is started in this process, and every
+scenario is run in a fresh child process against it, so that the peak
+RSS reported is that of the scenario alone.  A scenario is repeated until
+--min-time has passed.  Manager scenarios run once per --transport, none
+being troveclient's own unpooled requests; commands install the pooled
+transport themselves.  The connections and requests columns are counted
+by the server, and show the connection reuse of the transport.
+
+Needs python-troveclient, like the extension itself.
+"""
+
+import argparse
+import collections
+import contextlib
+import importlib
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_mgmt_api  # noqa
+
+
+EXTENSIONS = ('accounts_python_troveclient_ext',
+              'diagnostics_python_troveclient_ext',
+              'hosts_python_troveclient_ext',
+              'hwinfo_python_troveclient_ext',
+              'management_cluster_python_troveclient_ext',
+              'management_flavor_python_troveclient_ext',
+              'management_python_troveclient_ext',
+              'quota_python_troveclient_ext',
+              'storage_python_troveclient_ext')
+
+FIELDS = ['size', 'scenario', 'transport', 'calls', 'items', 'p50_ms',
+          'p95_ms', 'max_ms', 'ops_per_s', 'items_per_s', 'peak_rss_mb',
+          'rss_delta_mb', 'connections', 'requests', 'kb_received', 'error']
+
+
+def make_client(url, session=False):
+    """Return a troveclient v1 Client with the extensions, talking to the
+    FakeMgmtAPI at url.  The token is set up front so no auth is needed.
+
+    With session set the client is a SessionClient on a keystone session,
+    as the trove shell builds it, which needs keystoneauth1.
+    """
+    from troveclient import extension
+    from troveclient.v1 import client
+
+    extensions = [extension.Extension(name, importlib.import_module(name))
+                  for name in EXTENSIONS]
+    if session:
+        from keystoneauth1 import session as ks_session
+        from keystoneauth1 import token_endpoint
+
+        auth = token_endpoint.Token(url + '/v1.0/admin', 'fake-token')
+        return client.Client('admin', 'admin', auth=auth,
+                             session=ks_session.Session(auth=auth),
+                             extensions=extensions)
+    cs = client.Client('admin', 'admin', project_id='admin',
+                       auth_url=url + '/v2.0', extensions=extensions)
+    cs.client.management_url = url + '/v1.0/admin'
+    cs.client.auth_token = 'fake-token'
+    return cs
+
+
+def instance_ids(size, count):
+    return ['inst-%08d' % i for i in range(min(size, count))]
+
+
+def run_command(cs, name, argv=(), items=1):
+    """Run do_<name> as the trove shell would, its output discarded, and
+    return items.
+    """
+    func_name = 'do_' + name.replace('-', '_')
+    for module_name in EXTENSIONS:
+        func = getattr(importlib.import_module(module_name), func_name, None)
+        if func is not None:
+            break
+    parser = argparse.ArgumentParser(prog=name)
+    for args, kwargs in getattr(func, 'arguments', []):
+        parser.add_argument(*args, **kwargs)
+    args = parser.parse_args(list(argv))
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            func(cs, args)
+    return items
+
+
+def _count(results):
+    return len(list(results))
+
+
+def _one(result):
+    return 1
+
+
+# name: (function of (cs, size) returning the number of items, largest
+# fleet size it is run for, whether it is a command)
+SCENARIOS = collections.OrderedDict([
+    ('management.index', (
+        lambda cs, size: len(cs.management_python_troveclient_ext.index(
+            limit=100)), None, False)),
+    ('management.iter_index', (
+        lambda cs, size: _count(
+            cs.management_python_troveclient_ext.iter_index(
+                page_size=1000)), None, False)),
+    ('management.show', (
+        lambda cs, size: _one(cs.management_python_troveclient_ext.show(
+            'inst-00000000')), None, False)),
+    ('management.show_many', (
+        lambda cs, size: _count(
+            cs.management_python_troveclient_ext.show_many(
+                instance_ids(size, 100), concurrency=16)), None, False)),
+    ('management.bulk_action', (
+        lambda cs, size: _count(
+            cs.management_python_troveclient_ext.bulk_action(
+                'reboot', instance_ids(size, 100), concurrency=16)),
+        None, False)),
+    ('management.root_enabled_history', (
+        lambda cs, size: _one(
+            cs.management_python_troveclient_ext.root_enabled_history(
+                'inst-00000000')),
+        None, False)),
+    ('clusters.iter_index', (
+        lambda cs, size: _count(
+            cs.management_cluster_python_troveclient_ext.iter_index(
+                page_size=1000)), None, False)),
+    ('hosts.index', (
+        lambda cs, size: len(cs.hosts_python_troveclient_ext.index()),
+        None, False)),
+    ('hosts.get', (
+        lambda cs, size: len(cs.hosts_python_troveclient_ext.get(
+            'host-0000').instances), None, False)),
+    ('accounts.index', (
+        lambda cs, size: len(cs.accounts_python_troveclient_ext.index()),
+        None, False)),
+    ('accounts.show', (
+        lambda cs, size: _one(cs.accounts_python_troveclient_ext.show(
+            'tenant-00000')), None, False)),
+    ('quotas.show', (
+        lambda cs, size: _one(cs.quota_python_troveclient_ext.show(
+            'tenant-00000')), None, False)),
+    ('storage.index', (
+        lambda cs, size: len(cs.storage_python_troveclient_ext.index()),
+        None, False)),
+    ('diagnostics.get', (
+        lambda cs, size: _one(cs.diagnostics_python_troveclient_ext.get(
+            'inst-00000000')), None, False)),
+    ('hwinfo.get', (
+        lambda cs, size: _one(cs.hwinfo_python_troveclient_ext.get(
+            'inst-00000000')), None, False)),
+    ('mgmt-list', (
+        lambda cs, size: run_command(cs, 'mgmt-list', items=20), None, True)),
+    ('mgmt-list --stream', (
+        lambda cs, size: run_command(
+            cs, 'mgmt-list', ['--stream', '--page-size', '1000'], size),
+        None, True)),
+    ('mgmt-show', (
+        lambda cs, size: run_command(
+            cs, 'mgmt-show', instance_ids(size, 10), min(size, 10)),
+        None, True)),
+    ('mgmt-cluster-list --stream', (
+        lambda cs, size: run_command(
+            cs, 'mgmt-cluster-list', ['--stream', '--page-size', '1000'],
+            size // 30), None, True)),
+    ('mgmt-host-list', (
+        lambda cs, size: run_command(cs, 'mgmt-host-list'),
+        None, True)),
+    ('mgmt-host-show', (
+        lambda cs, size: run_command(cs, 'mgmt-host-show',
+                                     ['host-0000']), None, True)),
+    ('mgmt-account-list', (
+        lambda cs, size: run_command(cs, 'mgmt-account-list'),
+        None, True)),
+    ('mgmt-quota-show', (
+        lambda cs, size: run_command(cs, 'mgmt-quota-show',
+                                     ['tenant-00000']), None, True)),
+    ('mgmt-diagnostics-collect', (
+        lambda cs, size: run_command(
+            cs, 'mgmt-diagnostics-collect',
+            ['--status', 'any', '--format', 'jsonl', '--concurrency', '16',
+             '--output', os.devnull], size), 10000, True)),
+    ('mgmt-inventory-sync', (
+        lambda cs, size: run_command(
+            cs, 'mgmt-inventory-sync',
+            ['--full', '--page-size', '1000', '--snapshot',
+             os.path.join(tempfile.gettempdir(),
+                          'bench-inventory-%d.json' % os.getpid())], size),
+        None, True)),
+])
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100.0 *
+                                           (len(values) - 1))))
+    return values[index]
+
+
+def run_scenario(url, name, size, transport, min_time, max_calls):
+    """Run one scenario in this process and return its measurements."""
+    import mgmt_python_troveclient_transport as mgmt_transport
+
+    func = SCENARIOS[name][0]
+    cs = make_client(url)
+    if transport == 'pooled':
+        mgmt_transport.install(cs)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = []
+    items = 0
+    error = None
+    start = time.time()
+    while len(latencies) < max_calls:
+        call_start = time.time()
+        try:
+            items += func(cs, size)
+        except Exception as e:
+            error = '%s: %s' % (e.__class__.__name__, e)
+            break
+        latencies.append(time.time() - call_start)
+        if time.time() - start >= min_time:
+            break
+    elapsed = sum(latencies)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result = {'calls': len(latencies), 'items': items, 'error': error,
+              'peak_rss_mb': round(peak / 1024.0, 1),
+              'rss_delta_mb': round((peak - baseline) / 1024.0, 1)}
+    if latencies:
+        result.update({
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(_percentile(latencies, 95) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+            'ops_per_s': round(len(latencies) / elapsed, 2),
+            'items_per_s': round(items / elapsed, 1)})
+    return result
+
+
+def _run_child(url, name, size, transport, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name,
+               '--url', url, '--sizes', str(size), '--transport', transport,
+               '--min-time', str(args.min_time),
+               '--max-calls', str(args.max_calls)]
+    output = subprocess.run(command, stdout=subprocess.PIPE,
+                            universal_newlines=True)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode or not lines:
+        return {'error': 'exited with %d' % output.returncode}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='10,1000,10000,100000',
+                        help='Comma separated fleet sizes.')
+    parser.add_argument('--scenarios', default=None,
+                        help='Only run the scenarios matching this regex, '
+                             'out of: %s.' % ', '.join(SCENARIOS))
+    parser.add_argument('--transport', default='none,pooled',
+                        help='Comma separated transports for the manager '
+                             'scenarios, none and/or pooled.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds the server waits before responding.')
+    parser.add_argument('--min-time', type=float, default=1.0,
+                        help='Seconds to repeat each scenario for.')
+    parser.add_argument('--max-calls', type=int, default=50,
+                        help='Most times to run each scenario.')
+    parser.add_argument('--format', default='table',
+                        choices=('table', 'csv', 'tsv', 'json', 'jsonl'))
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--url', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    if args.child:
+        print(json.dumps(run_scenario(args.url, args.child, sizes[0],
+                                      args.transport, args.min_time,
+                                      args.max_calls)))
+        return
+
+    import mgmt_python_troveclient_utils as mgmt_utils
+
+    names = [name for name in SCENARIOS
+             if not args.scenarios or re.search(args.scenarios, name)]
+    transports = args.transport.split(',')
+    rows = []
+    for size in sizes:
+        server = fake_mgmt_api.FakeMgmtAPI(fake_mgmt_api.Fleet(size),
+                                           latency=args.latency).start()
+        try:
+            for name in names:
+                func, max_size, is_command = SCENARIOS[name]
+                if max_size is not None and size > max_size:
+                    continue
+                for transport in (['command'] if is_command
+                                  else transports):
+                    before = dict(server.stats)
+                    row = {'size': size, 'scenario': name,
+                           'transport': transport}
+                    row.update(_run_child(server.url, name, size, transport,
+                                          args))
+                    for key in ('connections', 'requests'):
+                        row[key] = (server.stats[key] - before.get(key, 0))
+                    row['kb_received'] = round(
+                        (server.stats['bytes'] - before.get('bytes', 0)) /
+                        1024.0, 1)
+                    rows.append(row)
+                    sys.stderr.write('%(size)s %(scenario)s %(transport)s\n'
+                                     % row)
+        finally:
+            server.stop()
+    mgmt_utils.print_list(rows, FIELDS, args.format, obj_is_dict=True)
+    failed = [row for row in rows if row.get('error')]
+    if failed:
+        sys.stderr.write("%d of %d scenarios failed.\n"
+                         % (len(failed), len(rows)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
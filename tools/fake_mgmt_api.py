@@ -0,0 +1,466 @@
+# Copyright 2014 eBay Software Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A stand-in for the Trove management API, serving a synthetic fleet.
+
+Usage::
+
+    python tools/fake_mgmt_api.py --size 10000 --port 8779
+    trove --os-auth-url http://127.0.0.1:8779/v2.0 --os-username admin \\
+        --os-password admin --os-tenant-name admin mgmt-list
+
+It answers the /mgmt endpoints used by the extension managers, and a
+keystone v2 token request whose catalog points back at itself.  Listings
+are paginated the way Trove paginates them, GETs carry an ETag and honour
+If-None-Match, and bodies are gzipped when the client asks for it.
+Actions are accepted and recorded but change nothing, except quota
+updates.  Only the standard library is needed.
+"""
+
+import argparse
+import collections
+import gzip
+import hashlib
+import http.server
+import json
+import random
+import re
+import threading
+import time
+from urllib import parse
+
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 1000
+DEFAULT_QUOTAS = {'instances': 10, 'volumes': 100, 'backups': 50}
+STATUSES = ('ACTIVE',) * 16 + ('BUILD', 'REBOOT', 'SHUTDOWN', 'ERROR')
+DATASTORES = (('mysql', '5.5'), ('mysql', '5.6'), ('mongodb', '2.4'),
+              ('redis', '2.8'))
+
+
+class Fleet(object):
+    """Synthetic instances, clusters, hosts and tenants.
+
+    The same size and seed always give the same fleet.
+    """
+
+    def __init__(self, size, tenants=None, hosts=None, seed=0,
+                 migrate_seconds=1.0):
+        rng = random.Random(seed)
+        self.migrate_seconds = migrate_seconds
+        self.started = time.time()
+        self.migrations = {}
+        tenants = tenants or max(1, size // 20)
+        hosts = hosts or max(1, size // 40)
+        self.instances = collections.OrderedDict()
+        self.by_host = collections.defaultdict(list)
+        self.by_tenant = collections.defaultdict(list)
+        self.clusters = collections.OrderedDict()
+        self.quotas = {}
+        self.flavors = {}
+        self.actions = collections.Counter()
+        # Set to False to ignore changes-since, as some Troves do.
+        self.changes_since = True
+        for i in range(size):
+            datastore, version = DATASTORES[i % len(DATASTORES)]
+            created = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(
+                1388534400 + i * 60))
+            info = {
+                'id': 'inst-%08d' % i,
+                'name': 'db%d' % i,
+                'tenant_id': 'tenant-%05d' % rng.randrange(tenants),
+                'host': 'host-%04d' % rng.randrange(hosts),
+                'server_id': 'server-%08d' % i,
+                'status': rng.choice(STATUSES),
+                'task_description': 'No tasks for the instance.',
+                'flavor': {'id': str(1 + i % 7), 'links': []},
+                'volume': {'size': 1 + i % 100,
+                           'used': round(rng.random() * (1 + i % 100), 2)},
+                'datastore': {'type': datastore, 'version': version},
+                'created': created,
+                'updated': created,
+                'deleted': False,
+                'deleted_at': None,
+                'links': [],
+            }
+            self.instances[info['id']] = info
+            self.by_host[info['host']].append(info['id'])
+            self.by_tenant[info['tenant_id']].append(info['id'])
+        ids = list(self.instances)
+        for i in range(size // 30):
+            members = ids[i * 3:i * 3 + 3]
+            first = self.instances[members[0]]
+            self.clusters['cluster-%06d' % i] = {
+                'id': 'cluster-%06d' % i,
+                'name': 'cluster%d' % i,
+                'tenant_id': first['tenant_id'],
+                'datastore': {'type': 'mongodb', 'version': '2.4'},
+                'task': {'id': 1, 'name': 'NONE',
+                         'description': 'No tasks for the cluster.'},
+                'created': first['created'],
+                'updated': first['updated'],
+                'deleted_at': None,
+                'links': [],
+                'instances': [{'id': member,
+                               'name': self.instances[member]['name'],
+                               'type': 'member',
+                               'flavor': self.instances[member]['flavor'],
+                               'volume': {'size': self.instances[member][
+                                   'volume']['size']}}
+                              for member in members],
+            }
+
+    def page(self, items, key, query, base_url):
+        """Return one page of items the way Trove paginates listings."""
+        limit = min(int(query.get('limit') or DEFAULT_LIMIT), MAX_LIMIT)
+        start = 0
+        marker = query.get('marker')
+        if marker:
+            ids = [item['id'] for item in items]
+            start = ids.index(marker) + 1 if marker in ids else len(ids)
+        page = items[start:start + limit]
+        body = {key: page}
+        if start + limit < len(items):
+            next_query = dict(query, limit=limit, marker=page[-1]['id'])
+            body['links'] = [{'rel': 'next', 'href': '%s?%s' % (
+                base_url, parse.urlencode(sorted(next_query.items())))}]
+        return body
+
+    def list_instances(self, query):
+        if query.get('deleted') == 'true':
+            return []
+        if query.get('host'):
+            ids = self.by_host.get(query['host'], [])
+        elif query.get('tenant_id'):
+            ids = self.by_tenant.get(query['tenant_id'], [])
+        else:
+            ids = self.instances
+        items = [self.instances[id] for id in ids]
+        for key in ('tenant_id', 'status'):
+            if query.get(key):
+                items = [info for info in items
+                         if info[key].upper() == query[key].upper()]
+        if query.get('datastore'):
+            items = [info for info in items
+                     if info['datastore']['type'] == query['datastore']]
+        if self.changes_since and query.get('changes-since'):
+            items = [info for info in items
+                     if info['updated'] >= query['changes-since']]
+        if query.get('created_since'):
+            items = [info for info in items
+                     if info['created'] >= query['created_since']]
+        return items
+
+    def migrate(self, instance_id, host=None):
+        """Move an instance to host, or the host with the fewest
+        instances, after migrate_seconds in MIGRATE status.
+        """
+        info = self.instances[instance_id]
+        if host is None:
+            host = min((name for name in self.by_host if name != info['host']),
+                       key=lambda name: len(self.by_host[name]))
+        self.by_host[info['host']].remove(instance_id)
+        self.by_host[host].append(instance_id)
+        info['host'] = host
+        self.migrations[instance_id] = (info['status'],
+                                        time.time() + self.migrate_seconds)
+        info['status'] = 'MIGRATE'
+
+    def show_instance(self, instance_id):
+        if instance_id in self.migrations:
+            status, done = self.migrations[instance_id]
+            if time.time() >= done:
+                self.instances[instance_id]['status'] = status
+                del self.migrations[instance_id]
+        info = dict(self.instances[instance_id])
+        info['guest_status'] = {'state_description': 'running'}
+        info['ip'] = ['10.%d.%d.%d' % (int(instance_id[-6:-4]),
+                                       int(instance_id[-4:-2]),
+                                       int(instance_id[-2:]))]
+        return info
+
+    def host(self, name):
+        if name not in self.by_host:
+            raise KeyError(name)
+        ids = self.by_host[name]
+        used = sum(self.instances[id]['volume']['size'] for id in ids)
+        return {'name': name,
+                'percentUsed': min(100, len(ids) * 2),
+                'totalRAM': 131072,
+                'usedRAM': 2048 * len(ids),
+                'totalVolume': 4096,
+                'usedVolume': used,
+                'instances': [dict((key, self.instances[id][key]) for key in
+                                   ('id', 'name', 'status', 'server_id',
+                                    'tenant_id'))
+                              for id in ids]}
+
+    def account(self, tenant_id):
+        return {'id': tenant_id,
+                'instances': [dict((key, self.instances[id][key]) for key in
+                                   ('id', 'name', 'host', 'status',
+                                    'created', 'updated'))
+                              for id in self.by_tenant.get(tenant_id, [])]}
+
+    def root_history(self, instance_id):
+        """Root was enabled on every seventh instance, by one of three
+        users, a day after it was created.
+        """
+        n = int(instance_id.rsplit('-', 1)[1])
+        if n % 7:
+            return {'id': instance_id, 'created': 'Never', 'user': 'Nobody'}
+        created = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(
+            1388534400 + n * 60 + 86400))
+        return {'id': instance_id, 'created': created,
+                'user': 'admin%d' % (n % 3)}
+
+    def diagnostics(self, instance_id):
+        n = int(instance_id.rsplit('-', 1)[1])
+        # Every fifth guest leaks 10kB of RSS a second.
+        leak = int((time.time() - self.started) * 10) if n % 5 == 0 else 0
+        return {'version': '1.0', 'fdSize': 64, 'threads': 12,
+                'vmSize': 512000 + n % 1000 + int(time.time()) % 100,
+                'vmPeak': 600000, 'vmRss': 256000 + n % 997 + leak,
+                'vmHwm': 300000}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, delayed
+    # ACKs add 40ms to every response on a kept-alive connection.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        http.server.BaseHTTPRequestHandler.setup(self)
+        self.server.count('connections')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            http.server.BaseHTTPRequestHandler.log_message(self, format,
+                                                           *args)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _handle(self, method):
+        self.server.count('requests')
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = parse.urlsplit(self.path)
+        query = dict(parse.parse_qsl(url.query))
+        try:
+            body = self._read_body()
+            status, result = self.server.route(method, url.path, query, body,
+                                               self._base_url(url.path))
+        except KeyError as e:
+            status, result = 404, {'itemNotFound': {
+                'code': 404, 'message': 'Not found: %s' % e}}
+        except Exception as e:
+            status, result = 500, {'computeFault': {
+                'code': 500, 'message': str(e)}}
+        self._respond(status, result)
+
+    def _base_url(self, path):
+        return 'http://%s%s' % (self.headers.get('Host'), path)
+
+    def _respond(self, status, result):
+        data = json.dumps(result).encode('utf-8') if result is not None \
+            else b''
+        headers = {}
+        if status == 200 and self.command == 'GET':
+            etag = '"%s"' % hashlib.md5(data).hexdigest()
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                status, data = 304, b''
+        if (data and len(data) > 1024 and
+                'gzip' in (self.headers.get('Accept-Encoding') or '')):
+            data = gzip.compress(data, 1)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        if data:
+            headers['Content-Type'] = 'application/json'
+        headers['Content-Length'] = str(len(data))
+        if self.close_connection:
+            # As a real server would, so the client drops the connection.
+            headers['Connection'] = 'close'
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.count('bytes', len(data))
+
+
+class FakeMgmtAPI(http.server.ThreadingHTTPServer):
+    """Serve fleet on host:port; port 0 picks a free port."""
+    daemon_threads = True
+
+    def __init__(self, fleet, host='127.0.0.1', port=0, latency=0.0,
+                 verbose=False):
+        http.server.ThreadingHTTPServer.__init__(self, (host, port), Handler)
+        self.fleet = fleet
+        self.latency = latency
+        self.verbose = verbose
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        """The root URL, to which /v2.0 or /v1.0/<tenant> is appended."""
+        return 'http://%s:%d' % self.server_address[:2]
+
+    @property
+    def management_url(self):
+        return self.url + '/v1.0/admin'
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def route(self, method, path, query, body, base_url):
+        if path.rstrip('/').endswith('/tokens') and method == 'POST':
+            return 200, self._token()
+        match = re.match(r'^/v[^/]+/[^/]+(/mgmt/.*?)/?$', path)
+        if not match:
+            raise KeyError(path)
+        parts = match.group(1).strip('/').split('/')[1:]
+        fleet = self.fleet
+        kind, rest = parts[0], parts[1:]
+        if method == 'POST' and rest[-1:] == ['action']:
+            if kind == 'instances' and rest[0] not in fleet.instances:
+                raise KeyError(rest[0])
+            action = list(body)[0] if body else None
+            fleet.actions[(kind, action)] += 1
+            if kind == 'instances' and action == 'migrate':
+                fleet.migrate(rest[0], body['migrate'].get('host'))
+            if kind == 'clusters' and action == 'reset-task':
+                fleet.clusters[rest[0]]['task'] = {
+                    'id': 1, 'name': 'NONE',
+                    'description': 'No tasks for the cluster.'}
+            return 202, None
+        if kind == 'instances':
+            if not rest:
+                body = fleet.page(fleet.list_instances(query), 'instances',
+                                  query, base_url)
+                if query.get('fields'):
+                    fields = query['fields'].split(',')
+                    body['instances'] = [
+                        dict((field, info[field]) for field in fields
+                             if field in info) for info in body['instances']]
+                return 200, body
+            if len(rest) == 1:
+                return 200, {'instance': fleet.show_instance(rest[0])}
+            if rest[0] not in fleet.instances:
+                raise KeyError(rest[0])
+            if rest[1] == 'root':
+                return 200, {'root_history': fleet.root_history(rest[0])}
+            if rest[1] == 'diagnostics':
+                return 200, {'diagnostics': fleet.diagnostics(rest[0])}
+            if rest[1] == 'hwinfo':
+                return 200, {'hwinfo': {'mem_total': 4096, 'num_cpus': 2}}
+        elif kind == 'clusters':
+            if not rest:
+                deleted = query.get('deleted') == 'true'
+                return 200, fleet.page(
+                    [cluster for cluster in fleet.clusters.values()
+                     if cluster.get('deleted', False) == deleted],
+                    'clusters', query, base_url)
+            return 200, {'cluster': fleet.clusters[rest[0]]}
+        elif kind == 'hosts':
+            if not rest:
+                return 200, {'hosts': [
+                    {'name': name, 'instanceCount': len(ids)}
+                    for name, ids in sorted(fleet.by_host.items())]}
+            return 200, {'host': fleet.host(rest[0])}
+        elif kind == 'accounts':
+            if not rest:
+                return 200, {'accounts': [
+                    {'id': tenant_id, 'num_instances': len(ids)}
+                    for tenant_id, ids in sorted(fleet.by_tenant.items())]}
+            return 200, {'account': fleet.account(rest[0])}
+        elif kind == 'quotas':
+            quotas = fleet.quotas.setdefault(rest[0], dict(DEFAULT_QUOTAS))
+            if method == 'PUT':
+                quotas.update(body['quotas'])
+            return 200, {'quotas': quotas}
+        elif kind == 'storage':
+            return 200, {'devices': [
+                {'name': 'ceph', 'type': 'ceph', 'used': 1024,
+                 'capacity': {'total': 65536, 'available': 64512},
+                 'provision': {'total': 65536, 'available': 64512,
+                               'percent': 10}}]}
+        elif kind == 'flavors' and method == 'POST':
+            flavor = dict(body['flavor'], id=str(len(fleet.flavors) + 100))
+            fleet.flavors[flavor['id']] = flavor
+            return 200, {'flavor': flavor}
+        raise KeyError(path)
+
+    def _token(self):
+        endpoint = {'region': 'RegionOne',
+                    'publicURL': self.management_url,
+                    'internalURL': self.management_url,
+                    'adminURL': self.management_url}
+        return {'access': {
+            'token': {'id': 'fake-token', 'expires': '2099-01-01T00:00:00Z',
+                      'tenant': {'id': 'admin', 'name': 'admin'}},
+            'serviceCatalog': [{'type': 'database', 'name': 'trove',
+                                'endpoints': [endpoint]}],
+            'user': {'id': 'admin', 'name': 'admin', 'roles': []}}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8779)
+    parser.add_argument('--size', type=int, default=1000,
+                        help='Number of instances in the fleet.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds to wait before each response.')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    server = FakeMgmtAPI(Fleet(args.size), args.host, args.port,
+                         latency=args.latency, verbose=args.verbose)
+    print("Serving %d instances, management URL %s" %
+          (args.size, server.management_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()